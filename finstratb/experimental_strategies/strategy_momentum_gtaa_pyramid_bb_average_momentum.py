@@ -34,11 +34,13 @@ from finstratb.misc.helpers import (
     get_yahooquery_data_from_file,
     get_single_ticker_data_from_file,
 )
-from finstratb.misc.momentum import Momentum
+from finstratb.misc.momentum import Momentum, multi_momentum
 from finstratb.misc.positioning import PyramidPositioning, EmptyPositionQueueException
 import collections
 import quantstats
 
+AverageMomentum = multi_momentum((30, 90, 250), weights=(1, 2, 1))
+
 
 class BuyAndHold_1(bt.Strategy):
     def __init__(self):
@@ -117,17 +119,8 @@ class Strategy(bt.Strategy):
         self.open_orders = {}
 
         for d in self.stocks:
-            self.inds[d]["mom_30"] = Momentum(
-                d.close, period=30
-            )
-            
-            self.inds[d]["mom_90"] = Momentum(
-                d.close, period=90
-            )
-            
-            self.inds[d]["mom_250"] = Momentum(
-                d.close, period=250
-            )
+            # 30/90/250 day momentum and their 1/2/1 weighted average from one indicator
+            self.inds[d]["momentum"] = AverageMomentum(d.close)
             
             
             self.inds[d]["sma200"] = bt.indicators.EMA(
@@ -315,11 +308,11 @@ class Strategy(bt.Strategy):
             #]  # self.d_with_len #
 
         top_long_momentums = sorted(
-            all_valid_etfs, key=lambda d: (1*self.inds[d]["mom_30"][0] + 2*self.inds[d]["mom_90"][0] + 1*self.inds[d]["mom_250"][0])/4.0, reverse=True
+            all_valid_etfs, key=lambda d: self.inds[d]["momentum"].blend[0], reverse=True
         )[: self.p.max_stocks+2]
 
         momentum_values = [
-            f"{d._name}:{(1*self.inds[d]['mom_30'][0] + 2*self.inds[d]['mom_90'][0] + 1*self.inds[d]['mom_250'][0])/4.0:.3f}" for d in top_long_momentums]
+            f"{d._name}:{self.inds[d]['momentum'].blend[0]:.3f}" for d in top_long_momentums]
 
         print(f"MOMENTUM VALUES: {', '.join(momentum_values)}")
         # top_long_momentums = [d for d in top_long_momentums if d not in negative_short_momentums][:self.p.max_stocks]
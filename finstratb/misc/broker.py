@@ -0,0 +1,88 @@
+""" Backtest broker whose per-bar work scales with the open positions.
+
+`BackBroker.next` walks every position it has ever seen three times per bar (interest credit, cash adjustment,
+mark-to-market), and the broker sees a position for every feed that was ever ordered or valued. Only open
+positions contribute to any of the three, so `FastBroker` keeps the open ones in the order of the broker's
+position map and runs the unchanged `BackBroker` logic over them. The mark-to-market is taken once per bar, at the
+end of the broker's cycle, and `getvalue()` returns it until the next bar; fills, cash and values are identical to
+`BackBroker`, including cheat-on-close.
+
+    cerebro.broker = FastBroker()
+    cerebro.broker.set_coc(True)
+"""
+
+from typing import Dict, List
+
+import backtrader as bt
+
+
+class _OpenPositions:
+    """Mapping of the broker's positions that iterates over the open ones only"""
+
+    def __init__(self, positions: Dict, open_datas: List) -> None:
+        self._positions = positions
+        self._open_datas = open_datas
+
+    def __getitem__(self, data):
+        return self._positions[data]
+
+    def __iter__(self):
+        return iter(list(self._open_datas))
+
+    def __len__(self) -> int:
+        return len(self._open_datas)
+
+    def items(self):
+        return [(data, self._positions[data]) for data in self._open_datas]
+
+
+class FastBroker(bt.brokers.BackBroker):
+    def start(self):
+        super(FastBroker, self).start()
+        self._rank = {}  # position of the data in the broker's position map
+        self._open_datas = []  # datas with an open position, in rank order
+
+    def _execute(self, order, ago=None, price=None, cash=None, position=None, dtcoc=None):
+        super(FastBroker, self)._execute(order, ago=ago, price=price, cash=cash, position=position, dtcoc=dtcoc)
+        if ago is not None:  # real execution, the position has changed
+            data = order.data._compensate if order.data._compensate is not None else order.data
+            self._track(data)
+
+    def _track(self, data) -> None:
+        positions = self._all_positions()
+        is_open = bool(positions[data])
+        if is_open == (data in self._open_datas):
+            return
+
+        if data not in self._rank:
+            # Keys are never removed from the position map, the rank of a data doesn't change
+            self._rank[data] = next(i for i, d in enumerate(positions) if d is data)
+        if is_open:
+            self._open_datas.append(data)
+            self._open_datas.sort(key=self._rank.__getitem__)
+        else:
+            self._open_datas.remove(data)
+
+    def _all_positions(self) -> Dict:
+        positions = self.positions
+        return positions._positions if isinstance(positions, _OpenPositions) else positions
+
+    def _over_open_positions(self, method, *args, **kwargs):
+        # Runs a BackBroker method with the position map restricted to the open positions for iteration,
+        # lookups (and creation) still go to the full map
+        if isinstance(self.positions, _OpenPositions):
+            return method(*args, **kwargs)
+        positions = self.positions
+        self.positions = _OpenPositions(positions, self._open_datas)
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self.positions = positions
+
+    def _get_value(self, datas=None, lever=False):
+        if datas:
+            return super(FastBroker, self)._get_value(datas=datas, lever=lever)
+        return self._over_open_positions(super(FastBroker, self)._get_value, lever=lever)
+
+    def next(self):
+        self._over_open_positions(super(FastBroker, self).next)
@@ -0,0 +1,110 @@
+""" Content-addressed on-disk cache of DataFrames.
+
+Entries are Parquet files named by the hash of everything they were computed from, so a changed input
+simply maps to a new entry. Writes are atomic (temporary file + rename), which makes the cache safe for
+concurrent writers, and the least recently used entries are evicted once the cache outgrows `max_bytes`.
+The size is tracked with a running count of the bytes written, the directory is only scanned when the count
+crosses `max_bytes` (and once on the first write), so a batch of writes doesn't rescan the cache per entry.
+"""
+
+import glob
+import hashlib
+import os
+import uuid
+from typing import Optional
+
+import pandas as pd
+from loguru import logger
+
+from finstratb.misc.price_store import FINSTRATB_HOME
+
+DEFAULT_CACHE_DIR = os.path.join(FINSTRATB_HOME, "cache")
+
+
+def fingerprint(*parts) -> str:
+    """Hex digest of the parts, pandas objects are hashed by content (index included)"""
+    h = hashlib.sha256()
+    for p in parts:
+        if isinstance(p, (pd.Series, pd.DataFrame)):
+            h.update(pd.util.hash_pandas_object(p).values.tobytes())
+        else:
+            h.update(repr(p).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class DiskCache:
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, max_bytes: int = 2 * 1024**3) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self._bytes: Optional[int] = None  # size as of the last scan plus the bytes written since, None until scanned
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.parquet")
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        path = self._path(key)
+        try:
+            data = pd.read_parquet(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:  # truncated by a crash or evicted while reading
+            logger.warning(f"Dropping unreadable cache entry {key}: {e}")
+            self._remove(path)
+            return None
+
+        self._touch(path)
+        return data
+
+    def put(self, key: str, data: pd.DataFrame) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        data.to_parquet(tmp_path)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)  # atomic, concurrent writers of the same key write the same content
+
+        # Overwritten entries are counted twice, which only brings the next scan forward
+        if self._bytes is None or self._bytes + size > self.max_bytes:
+            self.evict()
+        else:
+            self._bytes += size
+
+    def evict(self) -> None:
+        """Scans the cache and removes least recently used entries until it fits into max_bytes.
+
+        Called by `put` when the cache may have outgrown max_bytes. Entries written by other processes are
+        only seen by a scan, call it after a batch of writes to enforce the limit on the whole directory.
+        """
+        entries = []
+        for path in glob.glob(os.path.join(self.root, "*", "*.parquet")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # removed by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+        self._bytes = total
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        # mtime is used as the last access time, atime isn't reliable (noatime mounts)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
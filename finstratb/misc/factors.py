@@ -0,0 +1,167 @@
+""" Factor providers for the residual momentum engine.
+
+Fama-French factors are downloaded at most once per `max_age_days`, stored on disk as versioned Parquet files
+and shared by every momentum instance in the process. In offline mode only the stored versions are used,
+which allows running the momentum estimation in sandboxed batch jobs.
+Any other factor set (e.g. ETF returns, at any frequency) is passed in as a `FactorFrame`.
+
+Providers expose `get()`, `version` and `factor_columns` (the regressors, every column except the risk-free RF).
+"""
+
+import glob
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+from loguru import logger
+
+from finstratb.misc.price_store import FINSTRATB_HOME
+
+DEFAULT_FACTOR_DIR = os.path.join(FINSTRATB_HOME, "factors")
+
+# Factor tables already loaded in this process, (cache_dir, name) -> (version, factors)
+_LOADED: Dict[Tuple[str, str], Tuple[str, pd.DataFrame]] = {}
+
+
+class FactorsNotAvailableException(Exception):
+    pass
+
+
+# Monthly factor models of the Fama-French data library, model -> getFamaFrenchFactors function
+FACTOR_MODELS = {
+    "ff3": "famaFrench3Factor",
+    "ff5": "famaFrench5Factor",
+    "carhart": "carhart4Factor",
+}
+
+
+def _download_monthly(model: str) -> pd.DataFrame:
+    # getFamaFrenchFactors scrapes the data library page at import time, so it is only imported when needed
+    import getFamaFrenchFactors as gff
+
+    logger.info(f"Fetching {model} factor data...")
+    return getattr(gff, FACTOR_MODELS[model])(frequency="m")
+
+
+def factor_columns(factors: pd.DataFrame) -> List[str]:
+    """Regressors of a factor table, all columns but the risk-free rate"""
+    return [c for c in factors.columns if c != "RF"]
+
+
+def _content_digest(factors: pd.DataFrame) -> str:
+    return hashlib.sha1(pd.util.hash_pandas_object(factors).values.tobytes()).hexdigest()[:10]
+
+
+class FamaFrenchFactors:
+    """Monthly Fama-French factors indexed by month end, cached on disk under a content version"""
+
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_FACTOR_DIR,
+        offline: Optional[bool] = None,
+        max_age_days: int = 30,
+        model: str = "ff3",
+    ) -> None:
+        """
+        Args:
+            cache_dir (str): directory with the stored factor versions
+            offline (Optional[bool]): never download, use the latest stored version.
+                Defaults to the FINSTRATB_OFFLINE environment variable.
+            max_age_days (int): download again when the latest stored version is older than that
+            model (str): one of FACTOR_MODELS, ff3 (Mkt-RF, SMB, HML), ff5 (+ RMW, CMA) or carhart (+ MOM)
+        """
+        if model not in FACTOR_MODELS:
+            raise ValueError(f"Unknown factor model {model}, expected one of {', '.join(FACTOR_MODELS)}")
+        self.model = model
+        self.name = f"{model}_monthly"
+        self.cache_dir = cache_dir
+        self.offline = bool(int(os.environ.get("FINSTRATB_OFFLINE", "0"))) if offline is None else offline
+        self.max_age_days = max_age_days
+
+    @property
+    def version(self) -> str:
+        return self._load()[0]
+
+    def get(self) -> pd.DataFrame:
+        """Factors (e.g. Mkt-RF, SMB, HML, RF) indexed by month end"""
+        return self._load()[1]
+
+    @property
+    def factor_columns(self) -> List[str]:
+        return factor_columns(self.get())
+
+    def _load(self) -> Tuple[str, pd.DataFrame]:
+        key = (self.cache_dir, self.name)
+        if key not in _LOADED:
+            _LOADED[key] = self._read_or_download()
+        return _LOADED[key]
+
+    def _stored_versions(self) -> list:
+        return sorted(glob.glob(os.path.join(self.cache_dir, f"{self.name}_*.parquet")), key=os.path.getmtime)
+
+    def _read_or_download(self) -> Tuple[str, pd.DataFrame]:
+        stored = self._stored_versions()
+        if stored:
+            latest = stored[-1]
+            age_days = (pd.Timestamp.now() - pd.Timestamp.fromtimestamp(os.path.getmtime(latest))).days
+            if self.offline or age_days < self.max_age_days:
+                return self._read(latest)
+
+        if self.offline:
+            raise FactorsNotAvailableException(f"No stored {self.name} factors in {self.cache_dir} (offline mode)")
+
+        try:
+            factors = self._download()
+        except Exception as e:
+            if not stored:
+                raise
+            logger.warning(f"Failed to download factors ({e}), using the stored version")
+            return self._read(stored[-1])
+
+        return self._write(factors)
+
+    def _download(self) -> pd.DataFrame:
+        factors = _download_monthly(self.model).set_index("date_ff_factors")
+        factors.index = pd.DatetimeIndex(factors.index, name="date_ff_factors")
+        return factors.astype(float).sort_index()
+
+    def _read(self, path: str) -> Tuple[str, pd.DataFrame]:
+        version = os.path.basename(path)[len(self.name) + 1 : -len(".parquet")]
+        logger.info(f"Using {self.name} factors version {version}")
+        return version, pd.read_parquet(path)
+
+    def _write(self, factors: pd.DataFrame) -> Tuple[str, pd.DataFrame]:
+        # Version is the last available month and the content hash - unchanged data keeps its version
+        version = f"{factors.index[-1]:%Y%m}-{_content_digest(factors)}"
+        path = os.path.join(self.cache_dir, f"{self.name}_{version}.parquet")
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        factors.to_parquet(tmp_path)
+        os.replace(tmp_path, path)  # also refreshes mtime of an unchanged version
+        logger.info(f"Stored {self.name} factors version {version}")
+        return version, factors
+
+
+class FactorFrame:
+    """Custom factor set with the interface of `FamaFrenchFactors`, e.g. ETF returns or an extended model.
+
+    The table holds factor returns indexed by period end, at the frequency of the momentum engine.
+    An optional RF column is the risk-free rate subtracted from the stock returns.
+    """
+
+    def __init__(self, factors: pd.DataFrame, name: str = "custom") -> None:
+        self.name = name
+        self._factors = factors.astype(float).sort_index()
+        self.version = f"{name}-{_content_digest(self._factors)}"
+
+    def get(self) -> pd.DataFrame:
+        return self._factors
+
+    @property
+    def factor_columns(self) -> List[str]:
+        return factor_columns(self._factors)
+
+
+FactorProvider = Union[FamaFrenchFactors, FactorFrame]
@@ -0,0 +1,113 @@
+""" Array-backed data feeds.
+
+`bt.feeds.PandasData` copies the DataFrame into the line buffers one bar at a time through `iloc`.
+`ArrayData` takes the same frames (from `get_data` or `OHLCVPanel`) and fills every line in bulk
+from numpy arrays when cerebro preloads the data.
+"""
+
+import array
+from typing import Dict, Sequence
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+# Ordinal (backtrader/matplotlib style day number) of 1970-01-01
+_EPOCH_ORDINAL = 719163
+_NS_PER_DAY = 86400 * 10**9
+
+
+def dates_to_num(index: pd.DatetimeIndex) -> np.ndarray:
+    """Vectorized `bt.date2num` for naive timestamps"""
+    ns = index.values.astype("datetime64[ns]").astype(np.int64)
+    days = ns // _NS_PER_DAY
+    return (days + _EPOCH_ORDINAL).astype(np.float64) + (ns - days * _NS_PER_DAY) / _NS_PER_DAY
+
+
+class ArrayData(bt.feed.DataBase):
+    """Drop-in replacement of `bt.feeds.PandasData` for frames indexed by date
+    with (a subset of) open, high, low, close, volume, openinterest columns.
+
+    With preloading (cerebro default) all lines are filled with one bulk copy per line.
+    Without preloading, or with filters or input timezones, bars are delivered one by one from the arrays.
+    """
+
+    def start(self):
+        super(ArrayData, self).start()
+
+        data = self.p.dataname
+        self._dtnum = dates_to_num(data.index)
+        self._columns: Dict[str, np.ndarray] = {
+            name: data[name].to_numpy(dtype=np.float64)
+            for name in self.getlinealiases()
+            if name != "datetime" and name in data.columns
+        }
+        self._idx = -1
+
+    def _load(self):
+        self._idx += 1
+        if self._idx >= len(self._dtnum):
+            return False
+
+        for name, values in self._columns.items():
+            getattr(self.lines, name)[0] = values[self._idx]
+        self.lines.datetime[0] = self._dtnum[self._idx]
+        return True
+
+    def preload(self):
+        if self._filters or self._tzinput or not isinstance(self.lines.datetime.array, array.array):
+            return super(ArrayData, self).preload()
+
+        # Same from/to date semantics as DataBase.load, which skips bars before fromdate and stops after todate
+        mask = (self._dtnum >= self.fromdate) & (self._dtnum <= self.todate)
+        n_bars = int(mask.sum())
+        missing = np.full(n_bars, np.nan)
+
+        for name in self.getlinealiases():
+            if name == "datetime":
+                values = self._dtnum[mask]
+            elif name in self._columns:
+                values = self._columns[name][mask]
+            else:
+                values = missing
+            getattr(self.lines, name).array.frombytes(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+
+        self._idx = len(self._dtnum)
+        self._last()
+        self.home()
+
+
+_ARRAY_DATA_CLASSES = {}
+
+
+def array_data_class(extra_lines: Sequence[str] = ()) -> type:
+    """`ArrayData` with additional lines, filled from the frame columns of the same names
+    (e.g. precomputed indicators from `IndicatorStore`)"""
+    extra_lines = tuple(extra_lines)
+    if not extra_lines:
+        return ArrayData
+
+    if extra_lines not in _ARRAY_DATA_CLASSES:
+
+        class ArrayDataWithLines(ArrayData):
+            lines = extra_lines
+
+        _ARRAY_DATA_CLASSES[extra_lines] = ArrayDataWithLines
+    return _ARRAY_DATA_CLASSES[extra_lines]
+
+
+def add_data_feeds(
+    cerebro: bt.Cerebro, data: Dict[str, pd.DataFrame], extra_lines: Sequence[str] = (), **kwargs
+) -> None:
+    """Adds one `ArrayData` feed per symbol, in the order of `data` (benchmark first)
+
+    Args:
+        cerebro (bt.Cerebro): cerebro instance
+        data (Dict[str, pd.DataFrame]): symbol -> OHLCV frame, as returned by `get_data` or `OHLCVPanel.to_dict`
+        extra_lines (Sequence[str], optional): additional lines of every feed, filled from the frame columns
+            of the same names and NaN where a frame doesn't have the column
+        kwargs: feed parameters shared by all feeds, e.g. fromdate, todate, plot
+    """
+    feed_class = array_data_class(extra_lines)
+    for symbol, frame in data.items():
+        cerebro.adddata(feed_class(dataname=frame, name=symbol, **kwargs))
@@ -1,32 +1,124 @@
 
 from yahooquery import Ticker
-from typing import List, Dict
+from typing import List, Dict, Optional
+import numpy as np
 import pandas as pd
 from loguru import logger
+from pandas.api.types import union_categoricals
 
-def get_data(symbols: List[str], period = '35y',from_file = None, **kwargs) -> Dict[str, pd.DataFrame]:
+from finstratb.misc.price_store import PriceStore, DEFAULT_STORE_DIR
+
+YAHOOQUERY_COLUMNS = ['symbol', 'date', 'volume', 'open', 'high', 'low', 'adjclose']
+CSV_CHUNK_SIZE = 500_000
+MARKET_TZ = 'America/New_York'
+MARKET_CLOSE = pd.Timedelta(hours=16)
+
+
+def split_by_symbol(data: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Splits a long yahooquery frame (one row per symbol and date) into per-symbol frames in a single pass.
+
+    Rows are stably sorted by the categorical symbol codes, so each symbol becomes one contiguous slice
+    and the dates keep their original order. Symbols are returned in order of their first appearance.
+    """
+    symbol = pd.Categorical(data['symbol'])
+    codes = symbol.codes
+
+    order = np.argsort(codes, kind='stable')
+    data = (data.iloc[order]
+                .loc[:, ['date', 'volume', 'open', 'high', 'low', 'adjclose']]
+                .rename(columns = {'adjclose':'close'})
+                .set_index('date'))
+
+    bounds = np.searchsorted(codes[order], np.arange(len(symbol.categories) + 1))
+    return {symbol.categories[c]: data.iloc[bounds[c]:bounds[c + 1]] for c in pd.unique(codes) if c >= 0}
+
+
+def _fetch_history(symbols: List[str], **kwargs) -> Dict[str, pd.DataFrame]:
+    """Downloads daily history through yahooquery and splits it per symbol."""
 
     logger.info(f"Fetching {','.join(symbols)}")
     data = (Ticker(symbols = symbols)
-                .history(period=period, **kwargs)
+                .history(**kwargs)
                 .reset_index()
                 )
     data['date'] = pd.to_datetime(data['date'])
    # data.to_csv("etf_data.csv", index=False)
-    res_data = {s: (data.loc[data['symbol'] == s,['date','volume', 'open', 'high','low', 'adjclose']]
-                 .rename(columns = {'adjclose':'close'})
-                 .set_index('date')) for s in data['symbol'].unique()}
-    return res_data
+    return split_by_symbol(data)
+
+
+def last_session_close(now: Optional[pd.Timestamp] = None) -> pd.Timestamp:
+    """Close (16:00 New York time) of the last business day session that has ended, in UTC.
+
+    Exchange holidays aren't known, a holiday counts as a session. That only costs one extra sync.
+    """
+    now = pd.Timestamp.now(tz=MARKET_TZ) if now is None else now.tz_convert(MARKET_TZ)
+    close = pd.offsets.BDay().rollback(now.normalize().tz_localize(None)) + MARKET_CLOSE
+    if close > now.tz_localize(None):
+        close = pd.offsets.BDay().rollback(close.normalize() - pd.Timedelta(days=1)) + MARKET_CLOSE
+    return close.tz_localize(MARKET_TZ).tz_convert("UTC")
+
+
+def get_data(symbols: List[str], period = '35y', from_file = None, store_dir: Optional[str] = DEFAULT_STORE_DIR,
+             refresh: bool = False, **kwargs) -> Dict[str, pd.DataFrame]:
+    """Returns daily history for the symbols, served from the local price store.
+
+    Symbols missing from the store are downloaded for the full `period`. Stored symbols are only
+    synced from their last stored bar onwards (the last bar is re-fetched, it might have been stored intraday),
+    and only if they weren't synced since the close of the last session.
+
+    Args:
+        symbols (List[str]): tickers to fetch, the result keeps the same order
+        period (str, optional): history to download for symbols that aren't stored yet. Defaults to '35y'.
+        store_dir (Optional[str], optional): location of the price store, None disables the store.
+        refresh (bool, optional): download the full history again. Adjusted closes are rewritten
+            by the provider after dividends and splits, so the store should be refreshed from time to time.
+
+    Returns:
+        Dict[str, pd.DataFrame]: symbol -> OHLCV frame indexed by date
+    """
+    if store_dir is None:
+        return _fetch_history(symbols, period=period, **kwargs)
+
+    store = PriceStore(store_dir)
+    last_close = last_session_close()
+
+    missing = []
+    stale: Dict[pd.Timestamp, List[str]] = {}
+    for s in symbols:
+        last_date = None if refresh else store.last_date(s)
+        if last_date is None:
+            missing.append(s)
+        elif store.synced_at(s) < last_close:
+            stale.setdefault(last_date, []).append(s)
+
+    if missing:
+        for s, data in _fetch_history(missing, period=period, **kwargs).items():
+            store.write(s, data)
+
+    # Symbols synced together usually share the last stored date, so they are fetched in one request
+    for last_date, group in stale.items():
+        fetched = _fetch_history(group, start=last_date.strftime("%Y-%m-%d"), **kwargs)
+        for s in group:
+            # Symbols without new bars (e.g. on an exchange holiday) are marked as synced all the same
+            if s in fetched:
+                store.append(s, fetched[s])
+            else:
+                store.touch(s)
+
+    return {s: store.read(s) for s in symbols if s in store}
 
 def get_yahooquery_data_from_file(file_name: str) -> Dict[str, pd.DataFrame]:
     
     logger.info(f"Fetching from {file_name}")
-    data = pd.read_csv(file_name, parse_dates=['date'])
-    
-    res_data = {s: (data.loc[data['symbol'] == s,['date','volume', 'open', 'high','low', 'adjclose']]
-                 .rename(columns = {'adjclose':'close'})
-                 .set_index('date')) for s in data['symbol'].unique()}
-    return res_data
+    # Zipped dumps of large universes are parsed chunk by chunk, so the raw text is never fully in memory.
+    # Symbols are kept categorical, chunks can have different categories which are unioned at the end.
+    chunks = list(pd.read_csv(file_name, parse_dates=['date'], usecols=YAHOOQUERY_COLUMNS,
+                              dtype={'symbol': 'category'}, chunksize=CSV_CHUNK_SIZE))
+    symbol = union_categoricals([c['symbol'] for c in chunks])
+    data = pd.concat([c.drop(columns='symbol') for c in chunks], ignore_index=True)
+    data['symbol'] = symbol
+
+    return split_by_symbol(data)
 
 def get_single_ticker_data_from_file(file_name: str) -> pd.DataFrame:
     data = (pd
@@ -0,0 +1,151 @@
+""" Precomputed indicator lines for the data feeds.
+
+The strategies' per-ticker indicators (EMA, Bollinger Bands, ATR, percent change) only depend on the prices and
+the indicator parameters. `IndicatorStore` computes them vectorized over the whole price history, with the same
+definitions as the backtrader indicators, and persists every (ticker, indicator, params) series next to the price
+store. The series are added to the feeds as extra lines, so a strategy reads `d.ema150[-1]` instead of creating
+an indicator object per ticker in every run:
+
+    INDICATORS = [("ema", {"period": 150}), ("bbands", {"period": 20, "devfactor": 3})]
+    store = IndicatorStore()
+    add_data_feeds(cerebro, store.augment(data, INDICATORS), extra_lines=line_names(INDICATORS))
+
+The lines are not a drop-in replacement for the indicators, which is why the strategies only use them when
+asked to (`precompute_indicators` in their `__main__`):
+
+- Recursive indicators (EMA, ATR) are seeded at the start of the stored history rather than at the backtest's
+  fromdate, so their first values inside a backtest are warmed up instead of starting from a short average.
+- Feed lines advance with the data: in `notify_timer`, which cerebro calls before the strategy's indicators
+  are advanced to the new bar, `d.ema150[-1]` is the previous bar's value where `bt.ind.EMA(d)[-1]` is still the
+  one before it. In `next` both read the same values.
+"""
+
+import inspect
+import math
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+from finstratb.misc.disk_cache import DiskCache, fingerprint
+from finstratb.misc.price_store import FINSTRATB_HOME
+
+DEFAULT_INDICATOR_DIR = os.path.join(FINSTRATB_HOME, "indicators")
+
+IndicatorSpec = Tuple[str, Dict[str, float]]
+
+
+def _sma(x: np.ndarray, period: int) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    if len(x) >= period:
+        out[period - 1 :] = sliding_window_view(x, period).sum(axis=1) / period
+    return out
+
+
+def _smoothing(x: np.ndarray, period: int, alpha: float) -> np.ndarray:
+    """`bt.ind.ExponentialSmoothing`: seeded with the mean of the first period values, then
+    av = prev * (1 - alpha) + x * alpha"""
+    out = np.full(len(x), np.nan)
+    if len(x) >= period:
+        out[period - 1] = seed = math.fsum(x[:period]) / period
+        # Same products as the backtrader recursion: y = alpha * x + (1 - alpha) * prev
+        out[period:], _ = lfilter([alpha], [1.0, -(1.0 - alpha)], x[period:], zi=[(1.0 - alpha) * seed])
+    return out
+
+
+def ema(prices: pd.DataFrame, period: int) -> List[np.ndarray]:
+    """`bt.ind.EMA` of the close"""
+    return [_smoothing(prices["close"].to_numpy(dtype=np.float64), period, 2.0 / (1.0 + period))]
+
+
+def bbands(prices: pd.DataFrame, period: int, devfactor: float) -> List[np.ndarray]:
+    """`bt.ind.BBands` of the close: mid, top and bot"""
+    close = prices["close"].to_numpy(dtype=np.float64)
+    mid = _sma(close, period)
+    meansq = _sma(close**2, period)
+    stddev = devfactor * np.sqrt(np.abs(meansq - mid**2))
+    return [mid, mid + stddev, mid - stddev]
+
+
+def atr(prices: pd.DataFrame, period: int) -> List[np.ndarray]:
+    """`bt.ind.ATR`: Wilder smoothing of the true range, defined from the second bar"""
+    high, low, close = (prices[c].to_numpy(dtype=np.float64) for c in ("high", "low", "close"))
+    out = np.full(len(close), np.nan)
+    if len(close) > 1:
+        true_range = np.maximum(high[1:], close[:-1]) - np.minimum(low[1:], close[:-1])
+        out[1:] = _smoothing(true_range, period, 1.0 / period)
+    return [out]
+
+
+def pct_change(prices: pd.DataFrame, period: int) -> List[np.ndarray]:
+    """`bt.ind.PercentChange` of the close"""
+    close = prices["close"].to_numpy(dtype=np.float64)
+    out = np.full(len(close), np.nan)
+    out[period:] = close[period:] / close[:-period] - 1.0
+    return [out]
+
+
+# Indicator -> function and the suffixes of its lines
+INDICATORS: Dict[str, Tuple[Callable[..., List[np.ndarray]], Tuple[str, ...]]] = {
+    "ema": (ema, ("",)),
+    "bbands": (bbands, ("_mid", "_top", "_bot")),
+    "atr": (atr, ("",)),
+    "pct_change": (pct_change, ("",)),
+}
+
+
+def _params(indicator: str, params: Dict[str, float]) -> Tuple[Tuple[str, float], ...]:
+    # Parameters in the order of the function's signature, independent of the order they were passed in
+    names = list(inspect.signature(INDICATORS[indicator][0]).parameters)[1:]
+    return tuple((name, params[name]) for name in names)
+
+
+def indicator_lines(indicator: str, **params) -> List[str]:
+    """Feed line names of an indicator, e.g. ema150 or bbands20x3_mid/_top/_bot"""
+    if indicator not in INDICATORS:
+        raise ValueError(f"Unknown indicator {indicator}, expected one of {', '.join(INDICATORS)}")
+    values = "x".join(format(v, "g").replace(".", "_").replace("-", "m") for _, v in _params(indicator, params))
+    return [f"{indicator}{values}{suffix}" for suffix in INDICATORS[indicator][1]]
+
+
+def line_names(specs: Sequence[IndicatorSpec]) -> Tuple[str, ...]:
+    """Feed line names of all indicators, for `add_data_feeds(..., extra_lines=...)`"""
+    return tuple(name for indicator, params in specs for name in indicator_lines(indicator, **params))
+
+
+def feed_lines(data, indicator: str, **params) -> Optional[list]:
+    """The indicator's precomputed lines on the feed, None if the feed doesn't carry them"""
+    lines = [getattr(data.lines, name, None) for name in indicator_lines(indicator, **params)]
+    return None if any(line is None for line in lines) else lines
+
+
+class IndicatorStore:
+    """Indicator series per (ticker, indicator, params), persisted in a content-addressed cache.
+
+    Entries are keyed by the ticker's prices as well, so appended or revised bars map to new entries.
+    """
+
+    def __init__(self, root: str = DEFAULT_INDICATOR_DIR, max_bytes: int = 2 * 1024**3) -> None:
+        self.cache = DiskCache(root, max_bytes=max_bytes)
+
+    def compute(self, symbol: str, prices: pd.DataFrame, specs: Sequence[IndicatorSpec]) -> pd.DataFrame:
+        """Indicator lines of the symbol, one column per line name, indexed like the prices"""
+        prices_digest = fingerprint(prices)
+        columns = {}
+        for indicator, params in specs:
+            names = indicator_lines(indicator, **params)
+            key = fingerprint("indicator", symbol, indicator, _params(indicator, params), prices_digest)
+            lines = self.cache.get(key)
+            if lines is None or not lines.index.equals(prices.index):
+                values = INDICATORS[indicator][0](prices, **params)
+                lines = pd.DataFrame(dict(zip(names, values)), index=prices.index)
+                self.cache.put(key, lines)
+            columns.update(lines.items())
+        return pd.DataFrame(columns, index=prices.index)
+
+    def augment(self, data: Dict[str, pd.DataFrame], specs: Sequence[IndicatorSpec]) -> Dict[str, pd.DataFrame]:
+        """Price frames with the indicator columns appended, ready for `add_data_feeds`"""
+        return {s: pd.concat([prices, self.compute(s, prices, specs)], axis=1) for s, prices in data.items()}
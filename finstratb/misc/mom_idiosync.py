@@ -4,15 +4,26 @@ https://papers.ssrn.com/abstract=2947044
 """
 
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import copy
 import datetime as dt
-from typing import List, Union
+import itertools
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
-import getFamaFrenchFactors as gff
 import numpy as np
 import pandas as pd
 import statsmodels.api as sm
 from loguru import logger
-from numpy_ext import rolling_apply
+from numpy.lib.stride_tricks import sliding_window_view
+
+from finstratb.misc.disk_cache import DiskCache, fingerprint
+from finstratb.misc.factors import FactorProvider, FamaFrenchFactors
+from finstratb.misc.panel import OHLCVPanel
+
+# Bump when the momentum calculation changes, so stale disk cache entries are not reused
+MOMENTUM_CACHE_VERSION = 1
 
 
 def rolling_residuals(dates: pd.Series, y: pd.Series, mkt_rf: pd.Series, smb: pd.Series, hml: pd.Series) -> float:
@@ -40,8 +51,209 @@ def rolling_residuals(dates: pd.Series, y: pd.Series, mkt_rf: pd.Series, smb: pd
     return residuals[-1]
 
 
+def _window_sums(values: np.ndarray, window: int) -> np.ndarray:
+    """Sums over every rolling window along the first axis.
+
+    The cumulative sums restart every `window` rows, so each window is assembled from at most two block-local sums.
+    Unlike differences of one long cumulative sum, the rounding error doesn't grow with the length of the series.
+    """
+    n = len(values)
+    padded = np.zeros((-(-n // window) * window,) + values.shape[1:])
+    padded[:n] = values
+    return _block_window_sums(padded, n, window)
+
+
+def _block_window_sums(padded: np.ndarray, n: int, window: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """`_window_sums` of the first n rows of a zero padded array of whole blocks, which is overwritten.
+    Callers summing many arrays of the same shape reuse `padded` and `out`."""
+    n_blocks = len(padded) // window
+    blocks = padded.reshape((n_blocks, window) + padded.shape[1:])
+    np.cumsum(blocks, axis=1, out=blocks)
+
+    sums = np.empty((len(padded) - window + 1,) + padded.shape[1:]) if out is None else out
+    sums[0] = blocks[0, -1]
+    # A window ending at offset o of block b is the block's sum up to o plus the rest of block b-1 after o
+    rest = sums[1:].reshape((n_blocks - 1, window) + padded.shape[1:])
+    np.subtract(blocks[:-1, -1:], blocks[:-1], out=rest)
+    rest += blocks[1:]
+    return sums[: n - window + 1]
+
+
+class _CompensatedSum:
+    """Running sum of arrays with Neumaier compensation, the error doesn't grow with the number of terms"""
+
+    def __init__(self, shape: tuple) -> None:
+        self.sum = np.zeros(shape)
+        self.compensation = np.zeros(shape)
+
+    def add(self, values: np.ndarray) -> None:
+        total = self.sum + values
+        self.compensation += np.where(
+            np.abs(self.sum) >= np.abs(values), (self.sum - total) + values, (values - total) + self.sum
+        )
+        self.sum = total
+
+    @property
+    def value(self) -> np.ndarray:
+        return self.sum + self.compensation
+
+
+def _solve_last(xtx: np.ndarray, x_last: np.ndarray) -> np.ndarray:
+    """(X'X)^-1 x_last for every window"""
+    try:
+        return np.linalg.solve(xtx, x_last)
+    except np.linalg.LinAlgError:
+        # Degenerate window (e.g. constant factor), fall back to the pseudo-inverse like statsmodels does
+        return np.linalg.pinv(xtx) @ x_last
+
+
+def rolling_last_residuals(y: np.ndarray, x: np.ndarray, window: int, method: str = "auto") -> np.ndarray:
+    """Vectorized version of `rolling_residuals`, fits every rolling window at once.
+
+        y ~ a0 + x @ b + eps
+
+    The regressors are shared by all stocks, so each window is reduced to g = (X'X)^-1 x_last and the last
+    residual of any stock is y_last - g' X'y. Two ways of getting there:
+
+    - "projection": the projection row h = X g of each window is applied to the stock returns of the window,
+      O(window) per window and stock. Cheapest for short windows (monthly data).
+    - "cross_products": X'X and X'y of every window are assembled from block-local cumulative sums of the cross
+      products, O(k) per window and stock independent of the window length. Used for long windows of daily or
+      weekly data.
+
+    "auto" picks the projection unless the window is long compared to the number of regressors.
+
+    Args:
+        y (np.ndarray): returns (corrected by risk-free rate), shape (n,) for one stock or (n, n_stocks)
+        x (np.ndarray): factor returns without the constant, shape (n, k), any k
+        window (int): number of observations in the rolling window
+        method (str, optional): "auto", "projection" or "cross_products". Defaults to "auto".
+
+    Returns:
+        np.ndarray: residual of the last observation of each window, same shape as y.
+            NaN for the first window-1 observations and for windows with missing returns or factors.
+    """
+    n = len(y)
+    residuals = np.full(y.shape, np.nan)
+    if n < window:
+        return residuals
+
+    missing_factors = np.isnan(x).reshape(n, -1).any(axis=1)
+    if missing_factors.any():
+        # Windows over periods without factors have no fit. The stretches of complete factors are fitted
+        # separately, so the missing rows never enter the window sums.
+        starts = np.flatnonzero(~missing_factors & np.concatenate([[True], missing_factors[:-1]]))
+        ends = np.flatnonzero(~missing_factors & np.concatenate([missing_factors[1:], [True]])) + 1
+        for start, end in zip(starts, ends):
+            residuals[start:end] = rolling_last_residuals(y[start:end], x[start:end], window, method)
+        return residuals
+
+    x = np.column_stack([np.ones(n), x])
+    n_regressors = x.shape[1]
+    if method == "auto":
+        # Projection costs one multiply-add per window observation and stock, the cross products about a dozen
+        # memory passes per regressor and stock (measured crossover ~60x regressors for a matrix, ~6x for one stock)
+        method = "projection" if window <= (60 if y.ndim > 1 else 6) * n_regressors else "cross_products"
+    x_last = x[window - 1 :, :, None]
+
+    if method == "projection":
+        x_windows = sliding_window_view(x, window, axis=0)  # (n_windows, k+1, window), no copy
+        xtx = x_windows @ np.swapaxes(x_windows, 1, 2)
+        projection = (np.swapaxes(x_windows, 1, 2) @ _solve_last(xtx, x_last))[:, :, 0]
+
+        y_windows = sliding_window_view(y, window, axis=0)  # (n_windows, [n_stocks,] window)
+        residuals[window - 1 :] = y[window - 1 :] - np.einsum("nw,n...w->n...", projection, y_windows)
+    elif method == "cross_products":
+        xtx = _window_sums(x[:, :, None] * x[:, None, :], window)
+        g = _solve_last(xtx, x_last)[:, :, 0]  # (n_windows, k+1)
+
+        # X'y one regressor at a time, which keeps the memory at O(n * n_stocks)
+        missing = _window_sums(np.isnan(y).astype(np.float64), window) > 0
+        y_filled = np.where(np.isnan(y), 0.0, y)
+        shape = (-1,) + (1,) * (y.ndim - 1)
+        fitted = np.zeros(residuals[window - 1 :].shape)
+        padded = np.zeros((-(-n // window) * window,) + y.shape[1:])
+        sums = np.empty((len(padded) - window + 1,) + y.shape[1:])
+        for j in range(n_regressors):
+            padded[n:] = 0.0
+            np.multiply(x[:, j].reshape(shape), y_filled, out=padded[:n])
+            window_sums = _block_window_sums(padded, n, window, out=sums)
+            fitted += np.multiply(g[:, j].reshape(shape), window_sums, out=window_sums)
+        residuals[window - 1 :] = np.where(missing, np.nan, y[window - 1 :] - fitted)
+    else:
+        raise ValueError(f"Unknown method {method}")
+
+    return residuals
+
+
+class RollingOLS:
+    """Online rolling regression of y on a constant and k factors, one observation in and one out per step.
+
+        y ~ a0 + x @ b + eps
+
+    X'X and X'y of the window are running sums with compensated summation, so the rounding error stays at the
+    level of a single window's sums however many steps were taken. Meant for streaming long daily windows.
+    """
+
+    def __init__(self, window: int, n_factors: int, n_stocks: Optional[int] = None) -> None:
+        """
+        Args:
+            window (int): number of observations in the rolling window
+            n_factors (int): number of factors, without the constant
+            n_stocks (Optional[int], optional): regress a vector of stocks on the same factors. Defaults to one stock.
+        """
+        self.window = window
+        dim = n_factors + 1
+        y_shape = () if n_stocks is None else (n_stocks,)
+        self._x = np.zeros((window, dim))
+        self._y = np.zeros((window,) + y_shape)
+        self._missing = np.zeros((window,) + y_shape, dtype=int)
+        self._xtx = _CompensatedSum((dim, dim))
+        self._xty = _CompensatedSum((dim,) + y_shape)
+        self._n_missing = np.zeros(y_shape, dtype=int)
+        self._count = 0
+
+    def push(self, x: np.ndarray, y: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """Adds an observation, drops the oldest one once the window is full.
+
+        Returns:
+            Union[float, np.ndarray]: residual of the new observation, NaN until the window is full
+                and while it holds missing returns
+        """
+        x = np.concatenate([[1.0], np.asarray(x, dtype=np.float64)])
+        y = np.asarray(y, dtype=np.float64)
+        missing = np.isnan(y)
+        y_filled = np.where(missing, 0.0, y)
+
+        slot = self._count % self.window
+        if self._count >= self.window:
+            old_x = self._x[slot]
+            self._xtx.add(-np.multiply.outer(old_x, old_x))
+            self._xty.add(-np.multiply.outer(old_x, self._y[slot]))
+            self._n_missing -= self._missing[slot]
+
+        self._xtx.add(np.multiply.outer(x, x))
+        self._xty.add(np.multiply.outer(x, y_filled))
+        self._n_missing += missing
+        self._x[slot], self._y[slot], self._missing[slot] = x, y_filled, missing
+        self._count += 1
+
+        if self._count < self.window:
+            residual = np.full(y.shape, np.nan)
+        else:
+            g = _solve_last(self._xtx.value, x[:, None])[:, 0]
+            residual = np.where(self._n_missing > 0, np.nan, y - g @ self._xty.value)
+        return residual[()] if residual.ndim == 0 else residual
+
+
+def rolling_online_residuals(y: np.ndarray, x: np.ndarray, window: int) -> np.ndarray:
+    """`rolling_last_residuals` computed step by step with `RollingOLS`"""
+    ols = RollingOLS(window, x.shape[1], None if y.ndim == 1 else y.shape[1])
+    return np.array([ols.push(x_t, y_t) for x_t, y_t in zip(x, y)]).reshape(y.shape)
+
+
 def idiosync_momentum(res: pd.Series, **kwargs) -> float:
-    """Calculates idiosyncratic momentum"""
+    """Calculates idiosyncratic momentum of a window of residuals, reference for `residual_momentum`"""
 
     n_month = kwargs.get("n_month", 5)
     r = res.iloc[-n_month:-1]
@@ -60,64 +272,549 @@ def idiosync_momentum(res: pd.Series, **kwargs) -> float:
     # return r.sum()  / r.std() #  / np.sqrt(len(r))
 
 
+# Months of residuals required up to the estimation month. The calculation itself uses the last n_month - 1 of them,
+# so this is just an upper limit.
+RESIDUAL_MOMENTUM_WINDOW = 15
+_RESIDUAL_MOMENTUM_CHUNK = 1 << 22  # residual values per contiguous copy of the windows
+
+# Frequencies of the momentum engine: pandas period alias, approximate period length and the offset from a period
+# label to the previous one. Monthly and weekly periods are labelled by their (calendar) last day, daily periods
+# are the trading days.
+FREQUENCIES = {
+    "M": ("M", pd.Timedelta(days=31), pd.offsets.MonthEnd(1)),
+    "W": ("W-FRI", pd.Timedelta(days=7), pd.offsets.Week(weekday=4)),
+    "D": ("D", pd.Timedelta(days=1), pd.offsets.Day(1)),
+}
+
+
+def _momentum_window(frequency: str, n_periods: int) -> int:
+    # Monthly keeps the historical 15 month upper limit, faster frequencies need at least the momentum window
+    return RESIDUAL_MOMENTUM_WINDOW if frequency == "M" else max(RESIDUAL_MOMENTUM_WINDOW, n_periods)
+
+
+def _period_labels(index: pd.DatetimeIndex, frequency: str) -> pd.DatetimeIndex:
+    """Label (last day) of the period of every timestamp"""
+    if frequency == "D":
+        return index.normalize()
+    return index.to_period(FREQUENCIES[frequency][0]).to_timestamp(how="end").normalize()
+
+
+def residual_momentum(
+    residuals: Union[pd.Series, pd.DataFrame], n_month: int, window: int = RESIDUAL_MOMENTUM_WINDOW
+) -> Union[pd.Series, pd.DataFrame]:
+    """Rolling idiosyncratic momentum of the residuals, column-wise for a residuals matrix.
+
+    Vectorized version of `residuals.rolling(15).apply(idiosync_momentum, kwargs={"n_month": n_month})`:
+    the weighted sum is one product with the fixed weights kernel over a sliding window of the lagged residuals,
+    and the normaliser is the standard deviation of the same windows.
+
+    Args:
+        residuals (Union[pd.Series, pd.DataFrame]): residuals of one or many stocks
+        n_month (int): periods of residuals in the momentum, the last one is skipped
+        window (int, optional): periods of residuals required up to the estimate. Defaults to 15.
+
+    Returns:
+        Union[pd.Series, pd.DataFrame]: same shape as residuals, NaN unless the last `window` residuals are available
+    """
+    values = residuals.to_numpy(dtype=np.float64)
+    momentum = np.full(values.shape, np.nan)
+
+    # Same periods as `res.iloc[-n_month:-1]` in a window of `window` periods: the last period is skipped
+    length = len(range(window)[-n_month:-1])
+    if length > 0 and len(values) >= window:
+        weights = np.linspace(1, length / 3, length)
+        weights = weights / np.sum(weights)
+
+        lagged = sliding_window_view(values[:-1], length, axis=0)  # windows ending one month before the estimate
+        # Windows are reduced as contiguous copies, which sums them in the same order as pandas does for a single
+        # window and keeps the results identical to `idiosync_momentum`. Chunks bound the memory of the copies.
+        chunk = max(1, _RESIDUAL_MOMENTUM_CHUNK // (lagged[0].size or 1))
+        for lo in range(0, len(lagged), chunk):
+            r = np.ascontiguousarray(lagged[lo : lo + chunk])
+            with np.errstate(invalid="ignore", divide="ignore"):
+                weighted_returns = (r * weights).sum(axis=-1)
+                volatility = r.std(axis=-1, ddof=1) if length > 1 else np.full(weighted_returns.shape, np.nan)
+                momentum[length + lo : length + lo + len(r)] = weighted_returns / np.sqrt(volatility) / np.sqrt(length)
+
+        # Like rolling(15) with its default min_periods, the whole 15 month window must be available
+        missing = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(np.isnan(values), axis=0)])
+        incomplete = missing[window:] - missing[:-window] > 0
+        momentum[: window - 1] = np.nan
+        momentum[window - 1 :][incomplete] = np.nan
+
+    if isinstance(residuals, pd.DataFrame):
+        return pd.DataFrame(momentum, index=residuals.index, columns=residuals.columns)
+    return pd.Series(momentum, index=residuals.index, name=residuals.name)
+
+
+def as_of_row(dates: np.ndarray, date: Union[str, dt.datetime]) -> int:
+    """Row of the latest date not beyond `date` in sorted datetime64 `dates`, -1 if there is none.
+
+    As-of lookup of the momentum matrices, shared with `finstratb.misc.signals`.
+    """
+    return dates.searchsorted(np.datetime64(pd.Timestamp(date)), side="right") - 1
+
+
+AdaptiveParameters = namedtuple("AdaptiveParameters", "rolling_window_coeff rolling_window_mom")
+
+# Momentum of a parameter grid, values[i, d, t] is the momentum of params[i] at month end dates[d] for tickers[t]
+MomentumLattice = namedtuple("MomentumLattice", "params dates tickers values")
+
+
+def parameter_grid(coeff_windows: Iterable[int], mom_windows: Iterable[int]) -> List[AdaptiveParameters]:
+    """All (coefficient window, momentum window) pairs, e.g. parameter_grid([12, 24, 36], [6, 12, 24])"""
+    return [AdaptiveParameters(c, m) for c, m in itertools.product(coeff_windows, mom_windows)]
+
+
+def _momentum_lattice(
+    returns: pd.DataFrame, factors: pd.DataFrame, params: List[AdaptiveParameters], frequency: str = "M"
+) -> MomentumLattice:
+    """Momentum of every parameter pair from one panel (see `IdiosyncMomentum._monthly_panels`).
+
+    Residuals are computed once per distinct coefficient window for all tickers together,
+    the momentum of each pair is one vectorized pass over them.
+    """
+    params = [AdaptiveParameters(*p) for p in params]
+    residuals = {
+        window: pd.DataFrame(
+            rolling_last_residuals(returns.values, factors.values, window), index=returns.index, columns=returns.columns
+        )
+        for window in sorted({p.rolling_window_coeff for p in params})
+    }
+    values = np.empty((len(params), len(returns), len(returns.columns)))
+    for i, p in enumerate(params):
+        window = _momentum_window(frequency, p.rolling_window_mom)
+        values[i] = residual_momentum(residuals[p.rolling_window_coeff], p.rolling_window_mom, window).values
+    return MomentumLattice(params, returns.index, returns.columns, values)
+
+
+def _merge_lattices(
+    params: List[AdaptiveParameters], lattices: List[MomentumLattice], tickers: List[str]
+) -> MomentumLattice:
+    """One lattice from the lattices of disjoint panels, on the union of their dates (NaN where a ticker has no
+    period) with the tickers in the given order"""
+    params = [AdaptiveParameters(*p) for p in params]
+    if len(lattices) == 1 and list(lattices[0].tickers) == tickers:
+        return lattices[0]
+
+    dates = pd.DatetimeIndex(np.unique(np.concatenate([lat.dates.values for lat in lattices] or [[]])))
+    columns = {t: i for i, t in enumerate(tickers)}
+    values = np.full((len(params), len(dates), len(tickers)), np.nan)
+    for lat in lattices:
+        rows = dates.get_indexer(lat.dates)
+        values[:, rows[:, None], [columns[t] for t in lat.tickers]] = lat.values
+    return MomentumLattice(params, dates, pd.Index(tickers), values)
+
+
 class IdiosyncMomentum:
     """Implemements idiosyncratic momentum estimation for multiple stocks"""
 
-    def __init__(self, ticker_data: dict, rolling_window_coeff=24, rolling_window_mom=12):
+    def __init__(
+        self,
+        ticker_data: dict,
+        rolling_window_coeff=24,
+        rolling_window_mom=12,
+        factor_provider: Optional[FactorProvider] = None,
+        batch_universe: bool = True,
+        disk_cache: Optional[DiskCache] = None,
+        frequency: str = "M",
+    ):
+        """
+        Args:
+            ticker_data (dict): ticker -> daily prices
+            rolling_window_coeff (int, optional): periods in the rolling factor regression. Defaults to 24.
+            rolling_window_mom (int, optional): periods of residuals in the momentum. Defaults to 12.
+            factor_provider (Optional[FactorProvider], optional): source of the factors, any number of regressors.
+                Fama-French 3 factors from the shared on-disk cache by default.
+            batch_universe (bool, optional): on the first request compute all tickers together, reusing
+                the factor projections across tickers. Otherwise tickers are computed lazily one by one.
+            disk_cache (Optional[DiskCache], optional): persist the per-ticker momentum tables between runs,
+                keyed by the ticker's prices, the factor version and the windows.
+            frequency (str, optional): period of the returns and residuals, "M" (month end), "W" (week ending
+                Friday) or "D" (trading day). Weekly and daily need factors at that or a finer frequency,
+                e.g. a `FactorFrame` of daily factor returns, which are compounded to the period. Defaults to "M".
+        """
+        if frequency not in FREQUENCIES:
+            raise ValueError(f"Unknown frequency {frequency}, expected one of {', '.join(FREQUENCIES)}")
         logger.info("Initialazing Idiosyncratic Momentum...")
 
         self.ticker_data = ticker_data
         self.all_tickers = ticker_data.keys()
 
-        self.ff_factors = self.get_ff_factors()
+        self.frequency = frequency
+        self.factor_provider = factor_provider or FamaFrenchFactors()
+        self.ff_factors = self._factors_at_frequency(self.get_ff_factors())
+        self.factor_columns = self.factor_provider.factor_columns
         self.rolling_window_coeff = rolling_window_coeff
         self.rolling_window_mom = rolling_window_mom
+        self._momentum_window = _momentum_window(frequency, rolling_window_mom)
+        self.batch_universe = batch_universe
+        self.disk_cache = disk_cache
         self._cache = {}
+        self._momentum_matrix = None
 
     def get_ff_factors(self) -> pd.DataFrame:
-        """Retrieves the latest Fama-French factors"""
+        """Retrieves the latest Fama-French factors, indexed by month end (shared by all instances)"""
 
-        logger.info("Fetching Fama-French 3-factor data...")
-        factors = gff.famaFrench3Factor(frequency="m")
-        return factors.set_index("date_ff_factors").resample("D").pad()
+        return self.factor_provider.get()
 
-    def _estimate_momentum(self, ticker: str) -> pd.DataFrame:
-        logger.info(f"Calculating idiosyncratic momentum for {ticker}...")
-        t_data_monthly = (
-            self.ticker_data[ticker][["close"]]
-            .resample("M")
-            .last()
-            .assign(monthly_return=lambda df: df.pct_change())
+    def _factors_at_frequency(self, factors: pd.DataFrame) -> pd.DataFrame:
+        """Factors labelled like the periods of the returns, finer factor returns are compounded to the period"""
+        if self.frequency == "M" and len(factors) and factors.index.equals(_period_labels(factors.index, "M")):
+            return factors  # the monthly factors as published
+
+        if len(factors) > 1 and np.median(np.diff(factors.index.values)) > 1.5 * FREQUENCIES[self.frequency][1]:
+            raise ValueError(
+                f"Factors are coarser than the {self.frequency} frequency, pass factors of that or a finer frequency"
+            )
+        labels = _period_labels(factors.index, self.frequency)
+        if labels.is_unique:
+            return factors.set_axis(labels)
+        compounded = (1 + factors).groupby(labels).prod() - 1
+        compounded.index.name = factors.index.name
+        return compounded
+
+    def _monthly_returns(self, daily: pd.DataFrame) -> pd.DataFrame:
+        """Period-end closes and returns of the completed periods of the daily prices (monthly by default)"""
+        if self.frequency == "D":
+            closes = daily[["close"]].set_axis(daily.index.normalize())
+        else:
+            closes = daily[["close"]].resample(FREQUENCIES[self.frequency][0]).last()
+        return (
+            closes.assign(monthly_return=lambda df: df.pct_change())
             .fillna(0)
-            .iloc[:-1]  # Get rid of last observation as month isn't finished yet
+            .iloc[:-1]  # Get rid of last observation as the period isn't finished yet
         )
 
-        monthly_combined = (
-            t_data_monthly.merge(self.ff_factors, how="left", left_index=True, right_index=True)
-            .ffill()
+    def _merge_factors(self, t_data_monthly: pd.DataFrame, previous: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """Merges monthly returns with the factors, `previous` rows of the same table continue the forward fill"""
+        # Both sides are indexed by calendar month end, months after the last published factors are forward filled
+        merged = t_data_monthly.merge(self.ff_factors, how="left", left_index=True, right_index=True)
+        if previous is not None and len(previous):
+            merged = pd.concat([previous[merged.columns].iloc[-1:], merged]).ffill().iloc[1:]
+
+        return (
+            merged.ffill()
             .sort_index(ascending=True)
-            .assign(monthly_returns_less_rf=lambda df: df["monthly_return"] - df["RF"])
+            .assign(monthly_returns_less_rf=lambda df: df["monthly_return"] - df.get("RF", 0.0))
+        )
+
+    def _monthly_combined(self, ticker: str) -> pd.DataFrame:
+        """Monthly excess returns of the ticker merged with the factors"""
+        return self._merge_factors(self._monthly_returns(self.ticker_data[ticker]))
+
+    def _add_momentum(self, monthly_combined: pd.DataFrame) -> pd.DataFrame:
+        return monthly_combined.assign(
+            idiosync_momentum=lambda df: residual_momentum(
+                df["residuals"], self.rolling_window_mom, self._momentum_window
+            )
         )
 
+    def _estimate_momentum(self, ticker: str) -> pd.DataFrame:
+        logger.info(f"Calculating idiosyncratic momentum for {ticker}...")
+        monthly_combined = self._monthly_combined(ticker)
+
         monthly_combined = monthly_combined.assign(
-            residuals=rolling_apply(  # Calculates rolling regression based on 36 month window
-                rolling_residuals,
-                self.rolling_window_coeff,
-                monthly_combined.index.values,
+            residuals=rolling_last_residuals(  # Calculates rolling regression based on 24 month window
                 monthly_combined["monthly_returns_less_rf"].values,
-                monthly_combined["Mkt-RF"].values,
-                monthly_combined["SMB"].values,
-                monthly_combined["HML"].values,
-                n_jobs=1,  # Can increase parallelism
+                monthly_combined[self.factor_columns].values,
+                self.rolling_window_coeff,
+            )
+        )
+        return self._add_momentum(monthly_combined)
+
+    def _monthly_panels(
+        self, tickers: List[str]
+    ) -> Tuple[Dict[str, pd.DataFrame], List[Tuple[pd.DataFrame, pd.DataFrame]]]:
+        """Monthly tables of the tickers, plus their excess returns and the factors aligned on common period indexes.
+
+        Monthly and weekly returns share one index of all periods. Daily returns share the union of the trading
+        days, except for tickers missing some of those days within their history: a missing day would be a missing
+        return wiping out every window over it, so these tickers are aligned on their own trading days (one panel
+        per distinct calendar).
+
+        Returns:
+            Tuple[Dict[str, pd.DataFrame], List[Tuple[pd.DataFrame, pd.DataFrame]]]: per-ticker tables and
+                (periods x tickers excess returns, NaN outside of a ticker's history; periods x factors) panels
+        """
+        combined = {t: self._monthly_combined(t) for t in tickers}
+        combined = {t: df for t, df in combined.items() if len(df)}
+        if not combined:
+            return {}, []
+
+        if self.frequency == "D":
+            days = pd.DatetimeIndex(np.unique(np.concatenate([df.index.values for df in combined.values()])))
+            shared, calendars = [], {}
+            for t, df in combined.items():
+                if len(df) == days.searchsorted(df.index[-1], side="right") - days.searchsorted(df.index[0]):
+                    shared.append(t)
+                else:
+                    calendars.setdefault(df.index.values.tobytes(), []).append(t)
+            groups = [(days, shared)] if shared else []
+            groups += [(combined[group[0]].index, group) for group in calendars.values()]
+        else:
+            months = pd.date_range(
+                min(df.index[0] for df in combined.values()),
+                max(df.index[-1] for df in combined.values()),
+                freq=FREQUENCIES[self.frequency][0],
+            )
+            groups = [(months, list(combined))]
+
+        panels = []
+        for months, group in groups:
+            factors = (
+                self.ff_factors[self.factor_columns]
+                .reindex(months.union(self.ff_factors.index))
+                .ffill()
+                .reindex(months)  # NaN before the factor history, windows over those months have no residuals
             )
-        ).assign(
-            idiosync_momentum=lambda df: df["residuals"]
-            .rolling(  # Calculates rolling residual momentum
-                15
-            )  # Real calculation will be done on the window of less than 15 days, so this is just an upper limit.
-            .apply(idiosync_momentum, kwargs={"n_month": self.rolling_window_mom})
+            returns = pd.DataFrame({t: combined[t]["monthly_returns_less_rf"] for t in group}).reindex(months)
+            panels.append((returns, factors))
+        return combined, panels
+
+    def _estimate_universe(self, tickers: List[str]) -> dict:
+        """Same tables as `_estimate_momentum`, but the residuals of all tickers are computed together.
+
+        Returns are aligned on a common month-end index, so every window's factor projection
+        is computed once and applied to all tickers with one matrix product. Tickers without a completed
+        month get the same empty table as from `_estimate_momentum`, so they are cached like the others.
+        """
+        logger.info(f"Calculating idiosyncratic momentum for {len(tickers)} tickers...")
+        combined, panels = self._monthly_panels(tickers)
+
+        tables = {}
+        for returns, factors in panels:
+            residuals = rolling_last_residuals(returns.values, factors.values, self.rolling_window_coeff)
+            for i, t in enumerate(returns.columns):
+                df = combined[t]
+                tables[t] = self._add_momentum(df.assign(residuals=pd.Series(residuals[:, i], returns.index)[df.index]))
+        return {t: tables[t] if t in combined else self._estimate_momentum(t) for t in tickers}
+
+    def _disk_key(self, ticker: str) -> str:
+        close = self.ticker_data[ticker]["close"]
+        # The table only depends on the completed periods, new bars of the running period keep the key
+        running_month = close.index[-1].to_period(FREQUENCIES[self.frequency][0]) if len(close) else None
+        if running_month is not None:
+            close = close[close.index < running_month.start_time]
+        return fingerprint(
+            "idiosync_momentum",
+            MOMENTUM_CACHE_VERSION,
+            close,
+            running_month,
+            self.factor_provider.version,
+            self.rolling_window_coeff,
+            self.rolling_window_mom,
+        )
+
+    def _from_disk(self, tickers: List[str]) -> Tuple[List[str], Dict[str, str]]:
+        """Loads the tickers' momentum from the disk cache.
+
+        Returns:
+            Tuple[List[str], Dict[str, str]]: tickers still missing and their disk keys, for `_to_disk`
+        """
+        keys = {}
+        if self.disk_cache is not None:
+            for t in tickers:
+                keys[t] = self._disk_key(t)  # hashes the ticker's prices, computed once per fill
+                table = self.disk_cache.get(keys[t])
+                if table is not None:
+                    self._cache[t] = table
+        missing = [t for t in tickers if t not in self._cache]
+        return missing, {t: keys[t] for t in missing if t in keys}
+
+    def _to_disk(self, tables: Dict[str, pd.DataFrame], keys: Dict[str, str]) -> None:
+        if self.disk_cache is not None:
+            for t, table in tables.items():
+                self.disk_cache.put(keys[t], table)
+
+    def _fill_cache(self, tickers: List[str]) -> None:
+        """Loads the tickers' momentum from the disk cache, computes (and persists) the rest"""
+        missing, keys = self._from_disk([t for t in tickers if t not in self._cache])
+        if missing:
+            computed = self._compute(missing)
+            self._cache.update(computed)
+            self._to_disk(computed, keys)
+
+        self._momentum_matrix = None
+
+    def _compute(self, tickers: List[str]) -> Dict[str, pd.DataFrame]:
+        """Momentum tables of the tickers, batched unless `batch_universe` is off"""
+        if self.batch_universe:
+            return self._estimate_universe(tickers)
+        return {t: self._estimate_momentum(t) for t in tickers}
+
+    def _worker_copy(self, tickers: List[str], with_prices: bool = True) -> "IdiosyncMomentum":
+        """Picklable copy for the `warm` workers, holding only the prices of the tickers (or none at all,
+        when the worker reads them from the panel)"""
+        engine = copy.copy(self)
+        engine.ticker_data = {t: self.ticker_data[t] for t in tickers} if with_prices else {}
+        engine.all_tickers = list(tickers)
+        engine.disk_cache = None
+        engine._cache = {}
+        engine._momentum_matrix = None
+        return engine
+
+    def warm(
+        self, tickers: Optional[List[str]] = None, n_workers: Optional[int] = None, panel_path: Optional[str] = None
+    ) -> pd.Series:
+        """Computes the momentum tables of all (or given) tickers in a process pool, e.g. before `cerebro.run()`.
+
+        Tickers already cached in memory or on disk are skipped. Every worker computes an equal share of the
+        remaining tickers the same way `estimate_universe` does, the tables are returned into the shared cache
+        (and persisted to the disk cache).
+
+        Args:
+            tickers (Optional[List[str]], optional): defaults to all tickers
+            n_workers (Optional[int], optional): number of processes, defaults to the number of CPUs.
+                With 1 the tables are computed in this process.
+            panel_path (Optional[str], optional): `OHLCVPanel` holding the ticker data (e.g. `panel.path` of the
+                panel the data came from). Workers map the panel instead of receiving a pickled copy of the prices.
+
+        Returns:
+            pd.Series: seconds spent by each worker on its share, slowest first
+        """
+        missing, keys = self._from_disk([t for t in (tickers or self.all_tickers) if t not in self._cache])
+        if not missing:
+            return pd.Series(dtype=float, name="seconds")
+
+        n_workers = max(1, min(n_workers or os.cpu_count() or 1, len(missing)))
+        chunks = [missing[i::n_workers] for i in range(n_workers)]
+        start = time.perf_counter()
+        if n_workers == 1:
+            results = [_estimate_tickers(self._worker_copy(missing), missing)]
+        else:
+            engines = [self._worker_copy(c, with_prices=panel_path is None) for c in chunks]
+            with ProcessPoolExecutor(n_workers) as pool:
+                results = list(pool.map(_estimate_tickers, engines, chunks, [panel_path] * n_workers))
+
+        computed = {}
+        for tables, _ in results:
+            computed.update(tables)
+        self._cache.update(computed)
+        self._to_disk(computed, keys)
+        self._momentum_matrix = None
+
+        timings = pd.Series([seconds for _, seconds in results], name="seconds").sort_values(ascending=False)
+        logger.info(
+            f"Calculated momentum of {len(computed)} tickers in {time.perf_counter() - start:.1f}s "
+            f"with {n_workers} workers ({timings.sum():.1f}s of compute, slowest worker {timings.iloc[0]:.2f}s)"
         )
-        return monthly_combined
+        return timings
+
+    def estimate_universe(self, tickers: Optional[List[str]] = None) -> None:
+        """Caches momentum of all (or given) tickers in one batched pass"""
+        self._fill_cache(list(tickers or self.all_tickers))
+
+    def update(self, ticker: str, new_bars: pd.DataFrame) -> pd.DataFrame:
+        """Appends daily bars of the ticker and extends its cached momentum by the newly completed months.
+
+        Bars within the running month only extend the prices. When a month completes, only its regression
+        window and momentum value are computed, from the tail of the cached table. Bars revising an already
+        completed month trigger a full recalculation of the ticker.
+
+        Args:
+            ticker (str): ticker name, unknown tickers are added to the universe
+            new_bars (pd.DataFrame): daily bars with the columns of the ticker data, replace stored bars of the same date
+
+        Returns:
+            pd.DataFrame: rows added to the ticker's momentum table, empty when no month was completed
+        """
+        prices = self.ticker_data.get(ticker)
+        if prices is None or not len(prices):
+            prices = new_bars.sort_index()
+        elif len(new_bars) and new_bars.index[0] > prices.index[-1]:
+            prices = pd.concat([prices, new_bars.sort_index()])
+        else:
+            prices = pd.concat([prices, new_bars])
+            prices = prices[~prices.index.duplicated(keep="last")].sort_index()
+        self.ticker_data[ticker] = prices
+
+        table = self._cache.get(ticker)
+        if table is None:  # not computed yet, the new bars are picked up by the next request
+            return pd.DataFrame()
+
+        if not len(table) or (len(new_bars) and new_bars.index.min() <= table.index[-1]):
+            logger.info(f"Recalculating idiosyncratic momentum for {ticker}...")
+            del self._cache[ticker]
+            self._fill_cache([ticker])
+            return self._cache[ticker]
+
+        last_month = table.index[-1]
+        new_periods = _period_labels(prices.index[prices.index > last_month], self.frequency)
+        if not len(new_periods) or new_periods[-1] == new_periods[0]:
+            return table.iloc[:0]  # the period after the cached ones is still running
+
+        # Daily prices from the start of the last cached period, for the first new period's return
+        previous_period = FREQUENCIES[self.frequency][2]
+        t_data_monthly = self._monthly_returns(prices[prices.index > last_month - previous_period])
+        added = self._merge_factors(t_data_monthly[t_data_monthly.index > last_month], previous=table)
+
+        # Only the windows ending in the new months, the cached tail supplies the rest of each window
+        tail = len(added) + self.rolling_window_coeff - 1
+        returns = np.concatenate([table["monthly_returns_less_rf"].values, added["monthly_returns_less_rf"].values])
+        factors = np.concatenate([table[self.factor_columns].values, added[self.factor_columns].values])
+        residuals = rolling_last_residuals(returns[-tail:], factors[-tail:], self.rolling_window_coeff)[-len(added) :]
+
+        tail = len(added) + self._momentum_window - 1
+        residuals_tail = pd.Series(np.concatenate([table["residuals"].values, residuals])[-tail:])
+        momentum = residual_momentum(residuals_tail, self.rolling_window_mom, self._momentum_window)
+        momentum = momentum.values[-len(added) :]
+
+        added = added.assign(residuals=residuals, idiosync_momentum=momentum)
+        self._cache[ticker] = pd.concat([table, added])
+        self._momentum_matrix = None
+        if self.disk_cache is not None:
+            self.disk_cache.put(self._disk_key(ticker), self._cache[ticker])
+        return added
+
+    def momentum_lattice(
+        self, params: List[AdaptiveParameters], tickers: Optional[List[str]] = None
+    ) -> MomentumLattice:
+        """Momentum of all (or given) tickers for a grid of parameters, e.g. for sensitivity studies.
+
+        The monthly returns and factor alignment are shared by the whole grid, the regressions by all pairs
+        with the same coefficient window. The instance's own windows and cache are not used.
+
+        Args:
+            params (List[AdaptiveParameters]): (rolling_window_coeff, rolling_window_mom) pairs, see `parameter_grid`
+            tickers (Optional[List[str]], optional): defaults to all tickers
+
+        Returns:
+            MomentumLattice: (param, month end, ticker) momentum tensor, not forward filled
+        """
+        combined, panels = self._monthly_panels(list(tickers or self.all_tickers))
+        lattices = [_momentum_lattice(returns, factors, params, self.frequency) for returns, factors in panels]
+        return _merge_lattices(params, lattices, list(combined))
+
+    @property
+    def momentum_matrix(self) -> pd.DataFrame:
+        """Month end x tickers matrix of the momentum.
+
+        Values are forward filled after a ticker's last month, so every row holds the as-of value
+        that `get_momentum` returns for dates in that month. Tickers without a completed month are NaN columns.
+        """
+        if self._momentum_matrix is None:
+            self.estimate_universe()
+            self._momentum_matrix = (
+                pd.DataFrame({t: self._cache[t]["idiosync_momentum"] for t in self.all_tickers if t in self._cache})
+                .reindex(columns=list(self.all_tickers))
+                .sort_index()
+                .ffill()
+            )
+            self._matrix_dates = self._momentum_matrix.index.values
+            self._matrix_values = self._momentum_matrix.values
+        return self._momentum_matrix
+
+    def get_cross_section(self, date: Union[str, dt.datetime]) -> pd.Series:
+        """Momentum of all tickers as of the date (latest value not beyond the date), with one binary search.
+
+        Tickers without momentum at the date (history too short) are NaN.
+        """
+        matrix = self.momentum_matrix
+        row = as_of_row(self._matrix_dates, date)
+        if row < 0:
+            return pd.Series(np.nan, index=matrix.columns)
+        return pd.Series(self._matrix_values[row], index=matrix.columns)
 
     def get_momentum(self, ticker: str, date: Union[str, dt.datetime]) -> float:
         """Calculates residual (idiosyncratic) momentum for a giver ticker and date.
@@ -138,23 +835,59 @@ class IdiosyncMomentum:
 
         if ticker not in self._cache:
             logger.info(f"Caching data for {ticker}...")
-            self._cache[ticker] = self._estimate_momentum(ticker)
+            self._fill_cache(list(self.all_tickers) if self.batch_universe else [ticker])
 
-        data = self._cache[ticker][:date]
-        #  print(data.tail(10))
-        return data.iloc[-1]["idiosync_momentum"]
+        data = self._cache[ticker]
+        row = as_of_row(data.index.values, date)
+        if row < 0:
+            raise IndexError(f"No momentum for {ticker} on or before {date}")
+        return data["idiosync_momentum"].values[row]
 
 
-AdaptiveParameters = namedtuple("AdaptiveParameters", "rolling_window_coeff rolling_window_mom")
+def _estimate_tickers(
+    engine: IdiosyncMomentum, tickers: List[str], panel_path: Optional[str] = None
+) -> Tuple[Dict[str, pd.DataFrame], float]:
+    """Worker of `IdiosyncMomentum.warm`: momentum tables of the tickers and the seconds spent on them"""
+    start = time.perf_counter()
+    if panel_path is not None:
+        panel = OHLCVPanel(panel_path)
+        engine.ticker_data = {t: panel.frame(t) for t in tickers}
+    return engine._compute(tickers), time.perf_counter() - start
 
 
 class AdaptiveIdiosyncMomentum:
-    def __init__(self, ticker_data: dict, params: List[AdaptiveParameters]) -> None:
+    """Average of idiosyncratic momentum over several (coefficient window, momentum window) pairs.
+
+    The momentum of every pair is computed in one pass with `_momentum_lattice` (kept as `lattice`),
+    and the averaged momentum is precomputed.
+    """
+
+    def __init__(
+        self,
+        ticker_data: dict,
+        params: List[AdaptiveParameters],
+        factor_provider: Optional[FactorProvider] = None,
+        frequency: str = "M",
+    ) -> None:
         self.params = params
         logger.info("Initializing Adaptive Momentum")
-        self.momentum_list = [
-            IdiosyncMomentum(ticker_data, p.rolling_window_coeff, p.rolling_window_mom) for p in params
-        ]
+        self.all_tickers = ticker_data.keys()
+
+        engine = IdiosyncMomentum(ticker_data, factor_provider=factor_provider, frequency=frequency)
+        combined, panels = engine._monthly_panels(list(self.all_tickers))
+        lattices = [_momentum_lattice(returns, factors, params, frequency) for returns, factors in panels]
+        self.lattice = _merge_lattices(params, lattices, list(combined))
+
+        # Plain mean, missing momentum of any parameter set makes the average missing
+        self.momentum_matrix = (
+            pd.DataFrame(np.mean(self.lattice.values, axis=0), index=self.lattice.dates, columns=self.lattice.tickers)
+            .reindex(columns=list(self.all_tickers))
+            .ffill()
+        )
+        self._matrix_dates = self.momentum_matrix.index.values
+        self._matrix_values = self.momentum_matrix.values
+        self._ticker_col = {t: i for i, t in enumerate(self.momentum_matrix.columns)}
+        self._first_month = {t: df.index[0] for t, df in combined.items()}
 
     def get_momentum(self, ticker: str, date: Union[str, dt.datetime]) -> float:
         """Calculates residual (idiosyncratic) momentum for a giver ticker and date.
@@ -170,9 +903,20 @@ class AdaptiveIdiosyncMomentum:
             float: value of the residual momentum
         """
 
-        mom_values = [m.get_momentum(ticker, date) for m in self.momentum_list]
+        if ticker not in self.all_tickers:
+            raise KeyError(f"Data for {ticker} doesn't exist")
+
+        if ticker not in self._first_month or pd.Timestamp(date) < self._first_month[ticker]:
+            raise IndexError(f"No momentum for {ticker} on or before {date}")
+
+        return self._matrix_values[as_of_row(self._matrix_dates, date), self._ticker_col[ticker]]
 
-        return np.mean(mom_values)
+    def get_cross_section(self, date: Union[str, dt.datetime]) -> pd.Series:
+        """Average momentum of all tickers as of the date, see `IdiosyncMomentum.get_cross_section`"""
+        row = as_of_row(self._matrix_dates, date)
+        if row < 0:
+            return pd.Series(np.nan, index=self.momentum_matrix.columns)
+        return pd.Series(self._matrix_values[row], index=self.momentum_matrix.columns)
 
 
 if __name__ == "__main__":
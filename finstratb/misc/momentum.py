@@ -1,28 +1,251 @@
+import array
+import math
+from typing import Optional
+
 import backtrader as bt
-from scipy.stats import linregress
 import numpy as np
-import getFamaFrenchFactors as gff
-import datetime as dt
+
+ANNUALIZATION_DAYS = 252
+
+
+def trend_score(sxy, syy, period: int):
+    """Annualized regression slope of log prices scaled by |r| (same as `linregress` on x = 0..period-1).
+
+    Args:
+        sxy: sum of (x - mean(x)) * (y - mean(y)) over the window
+        syy: sum of (y - mean(y))^2 over the window
+        period (int): window length
+    """
+    sxx = period * (period * period - 1) / 12.0
+    slope = sxy / sxx
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rvalue = np.where(syy > 0, sxy / np.sqrt(sxx * syy), 0.0)  # linregress defines r = 0 for a flat window
+    rvalue = np.clip(rvalue, -1.0, 1.0)
+    return (1 + slope) ** ANNUALIZATION_DAYS * np.abs(rvalue)
+
+
+class BlockPrefixSums:
+    """Prefix sums of y, y^2 and i*y for rolling windows of up to `block` observations.
+
+    Plain prefix sums over a long series lose precision: the i*y sums grow with the square of the series length
+    and the window values are recovered by subtracting large numbers. Here the sums restart every `block` rows,
+    relative to the block's own origin and mean level. A window spans at most two blocks, so its sums are assembled
+    from block-local values and stay as accurate as summing the window directly.
+    """
+
+    def __init__(self, y: np.ndarray, block: int) -> None:
+        y = np.asarray(y, dtype=np.float64)
+        self.n = len(y)
+        self.block = block
+
+        missing = np.isnan(y)
+        self._missing = np.concatenate([[0], np.cumsum(missing)])
+
+        blocks = np.arange(self.n) // block
+        levels = np.array([np.nanmean(b) if (~np.isnan(b)).any() else 0.0 for b in np.split(y, range(block, self.n, block))])
+        self._levels = levels
+        dev = np.where(missing, 0.0, y - levels[blocks])
+        offset = np.arange(self.n) - blocks * block
+
+        # Inclusive block-local prefix sums, restarted at the first row of every block
+        self._s1 = self._block_cumsum(dev)
+        self._s2 = self._block_cumsum(dev * dev)
+        self._sj = self._block_cumsum(offset * dev)
+
+    def _block_cumsum(self, values: np.ndarray) -> np.ndarray:
+        padded = np.zeros(-(-self.n // self.block) * self.block)
+        padded[: self.n] = values
+        return np.cumsum(padded.reshape(-1, self.block), axis=1).ravel()[: self.n]
+
+    def window_sums(self, period: int):
+        """Centered sums of every window of `period` observations.
+
+        Returns:
+            tuple: sxy, syy and the number of missing values, one entry per window end (rows period-1..n-1)
+        """
+        if period > self.block:
+            raise ValueError(f"Window of {period} is longer than the block of {self.block}")
+
+        end = np.arange(period - 1, self.n)
+        start = end - period + 1
+        b_start, b_end = start // self.block, end // self.block
+        split = b_start != b_end
+
+        # Part of the window in the start block: rows start..min(end, last row of the block)
+        first_end = np.where(split, (b_start + 1) * self.block - 1, end)
+        before = start - 1
+        has_before = start % self.block != 0
+        a1 = self._s1[first_end] - np.where(has_before, self._s1[before], 0.0)
+        a2 = self._s2[first_end] - np.where(has_before, self._s2[before], 0.0)
+        aj = self._sj[first_end] - np.where(has_before, self._sj[before], 0.0)
+        # Shift the local row offsets to offsets from the window start
+        aj = aj - (start - b_start * self.block) * a1
+
+        # Part in the following block: rows from the start of the block to end, moved to the start block's level
+        n_b = np.where(split, end - b_end * self.block + 1, 0)
+        d = self._levels[b_end] - self._levels[b_start]
+        b1, b2, bj = (np.where(split, s[end], 0.0) for s in (self._s1, self._s2, self._sj))
+        o = b_end * self.block - start
+        sy = a1 + b1 + n_b * d
+        syy = a2 + b2 + 2 * d * b1 + n_b * d * d
+        sjy = aj + bj + d * n_b * (n_b - 1) / 2 + o * b1 + o * d * n_b
+
+        sxy = sjy - (period - 1) / 2.0 * sy
+        syy = syy - sy * sy / period
+        return sxy, syy, self._missing[end + 1] - self._missing[start]
+
+
+def rolling_trend(log_prices: np.ndarray, period: int, sums: Optional[BlockPrefixSums] = None) -> np.ndarray:
+    """Vectorized `Momentum` over a whole series of log prices, NaN for the first period-1 values
+    and for windows with missing prices."""
+    sums = sums or BlockPrefixSums(log_prices, period)
+    trend = np.full(len(log_prices), np.nan)
+    if len(log_prices) < period:
+        return trend
+
+    sxy, syy, missing = sums.window_sums(period)
+    trend[period - 1 :] = np.where(missing > 0, np.nan, trend_score(sxy, syy, period))
+    return trend
+
 
 class Momentum(bt.Indicator):
     lines = ('trend',)
     params = {'period': 90}
-    
+
     def __init__(self):
         self.addminperiod(self.params.period)
-    
-    def next(self):
+
+    def _reset_sums(self):
+        # Running sums are kept relative to the first log price of the window and rebuilt every `period` bars,
+        # which bounds the rounding drift of the updates
         log_ts = np.log(self.data.get(size=self.p.period))
-  #      returns = self.data.get(size=self.p.period)
-        x = np.arange(len(log_ts))
-        slope, _, rvalue, pvalue, stderr = linregress(x, log_ts)
-       # score = (1 + slope) ** 252
-        #annualized_slope = np.power(np.exp(slope), 252)-1
-        annualized_slope =  (1 + slope) ** 252 # np.power(np.exp(slope), 252)-1
-                
+        self._ref = log_ts[0]
+        y = log_ts - self._ref
+        self._sy = y.sum()
+        self._syy = (y * y).sum()
+        self._sxy = (np.arange(len(y)) * y).sum()
+        self._updates = 0
+
+    def _set_trend(self):
+        p = self.p.period
+        sxy = self._sxy - (p - 1) / 2.0 * self._sy
+        syy = self._syy - self._sy * self._sy / p
+        self.lines.trend[0] = float(trend_score(sxy, syy, p))
+
+    def nextstart(self):
+        self._reset_sums()
+        self._set_trend()
+
+    def next(self):
+        p = self.p.period
+        if self._updates >= p:
+            self._reset_sums()
+        else:
+            # O(1) window slide: y_old leaves at x = 0, every other x shifts by one, y_new enters at x = p - 1
+            y_old = math.log(self.data[-p]) - self._ref
+            y_new = math.log(self.data[0]) - self._ref
+            self._sxy += (p - 1) * y_new - (self._sy - y_old)
+            self._sy += y_new - y_old
+            self._syy += y_new * y_new - y_old * y_old
+            self._updates += 1
         # This implementation penalizes less volatile momentum stocks
-        self.lines.trend[0] = annualized_slope * np.abs(rvalue) 
-        
-        # This implementation results in higher sharpe ratio with lower returns
-        #self.lines.trend[0] = annualized_slope  * np.abs(rvalue) / stderr
-        
+        self._set_trend()
+
+    def once(self, start, end):
+        # The slice copies the buffer, a numpy view would pin the line's array and block its resizing
+        log_ts = np.log(np.frombuffer(self.data.array[:end], dtype=np.float64))
+        trend = rolling_trend(log_ts, self.p.period)
+        self.lines.trend.array[start:end] = array.array("d", trend[start:end].tobytes())
+
+
+class _MultiMomentumBase(bt.Indicator):
+    """`Momentum` over several periods (and optionally their weighted blend) from one set of log-price sums.
+
+    Created with `multi_momentum`, which declares one line per period.
+    """
+
+    params = {'periods': (30, 90, 250), 'weights': None}
+
+    def __init__(self):
+        self._max_period = max(self.p.periods)
+        self.addminperiod(self._max_period)
+        self._period_lines = [getattr(self.lines, f"mom_{p}") for p in self.p.periods]
+        if self.p.weights:
+            total = float(sum(self.p.weights))
+            self._weights = [w / total for w in self.p.weights]
+
+    def _reset_sums(self):
+        # Cumulative sums of y, y^2 and j*y since the anchor, relative to the anchor's log price.
+        # Every window is a difference of two entries; the anchor moves every min period bars, which keeps the
+        # cancellation in the short windows (and the O(max period) rebuild cost per bar) small.
+        log_ts = np.log(self.data.get(size=self._max_period))
+        self._ref = log_ts[0]
+        y = log_ts - self._ref
+        j = np.arange(len(y))
+        self._c1 = [0.0] + np.cumsum(y).tolist()
+        self._c2 = [0.0] + np.cumsum(y * y).tolist()
+        self._cj = [0.0] + np.cumsum(j * y).tolist()
+        self._j = len(y)
+
+    def _set_trends(self):
+        values = []
+        for p, line in zip(self.p.periods, self._period_lines):
+            sy = self._c1[-1] - self._c1[-1 - p]
+            syy = self._c2[-1] - self._c2[-1 - p] - sy * sy / p
+            # j*y sums shifted to x = 0..p-1 from the window start, then centered
+            sxy = self._cj[-1] - self._cj[-1 - p] - (self._j - p) * sy - (p - 1) / 2.0 * sy
+            line[0] = value = float(trend_score(sxy, syy, p))
+            values.append(value)
+        if self.p.weights:
+            self.lines.blend[0] = sum(w * v for w, v in zip(self._weights, values))
+
+    def nextstart(self):
+        self._reset_sums()
+        self._set_trends()
+
+    def next(self):
+        if self._j >= self._max_period + min(self.p.periods):
+            self._reset_sums()
+        else:
+            y = math.log(self.data[0]) - self._ref
+            self._c1.append(self._c1[-1] + y)
+            self._c2.append(self._c2[-1] + y * y)
+            self._cj.append(self._cj[-1] + self._j * y)
+            self._j += 1
+        self._set_trends()
+
+    def once(self, start, end):
+        log_ts = np.log(np.frombuffer(self.data.array[:end], dtype=np.float64))
+        sums = BlockPrefixSums(log_ts, self._max_period)
+        trends = [rolling_trend(log_ts, p, sums) for p in self.p.periods]
+        for line, trend in zip(self._period_lines, trends):
+            line.array[start:end] = array.array("d", trend[start:end].tobytes())
+        if self.p.weights:
+            blend = sum(w * t for w, t in zip(self._weights, trends))
+            self.lines.blend.array[start:end] = array.array("d", blend[start:end].tobytes())
+
+
+_MULTI_MOMENTUM_CLASSES = {}
+
+
+def multi_momentum(periods, weights=None):
+    """Indicator class with a `mom_<period>` line per period and, with weights, a `blend` line
+    holding their weighted average, e.g. `multi_momentum((30, 90, 250), weights=(1, 2, 1))(d.close)`.
+
+    Adding a period costs a few subtractions per bar, all periods share the same running sums.
+    """
+    periods = tuple(int(p) for p in periods)
+    weights = tuple(weights) if weights else None
+    if weights and len(weights) != len(periods):
+        raise ValueError(f"Got {len(weights)} weights for {len(periods)} periods")
+
+    key = (periods, weights)
+    if key not in _MULTI_MOMENTUM_CLASSES:
+        line_names = tuple(f"mom_{p}" for p in periods) + (('blend',) if weights else ())
+
+        class MultiMomentum(_MultiMomentumBase):
+            lines = line_names
+            params = {'periods': periods, 'weights': weights}
+
+        _MULTI_MOMENTUM_CLASSES[key] = MultiMomentum
+    return _MULTI_MOMENTUM_CLASSES[key]
@@ -0,0 +1,49 @@
+""" Basket orders for strategies.
+
+`order_target_percent` values the whole portfolio on every call, so a rebalance of N assets values it N times
+and the order in which the calls are made decides whether buys find the cash of the sells.
+`TargetWeightsMixin.order_target_weights` values the portfolio once and submits the basket sells first.
+
+    class Strategy(TargetWeightsMixin, bt.Strategy):
+        def rebalance(self):
+            self.order_target_weights({d: 0.25 for d in top})
+"""
+
+from typing import Dict, List
+
+import backtrader as bt
+
+
+class TargetWeightsMixin:
+    def order_target_weights(self, weights: Dict[bt.DataBase, float], **kwargs) -> List[bt.Order]:
+        """Orders every feed to its target weight of the portfolio value, like `order_target_percent` per feed.
+
+        The portfolio value is taken once for the whole basket and each position is read once. Orders reducing
+        a position are submitted before the orders increasing one, in the order of `weights` within each group.
+
+        Args:
+            weights (Dict[bt.DataBase, float]): feed -> target weight, 0 closes the position
+            **kwargs: passed to `buy`, `sell` and `close`
+
+        Returns:
+            List[bt.Order]: submitted orders, sells first
+        """
+        value = self.broker.getvalue()
+        sells, buys = [], []
+        for data, weight in weights.items():
+            target = weight * value
+            possize = self.getposition(data, self.broker).size
+            if not target and possize:  # closing a position
+                sells.append((self.close, data, {"size": possize}))
+                continue
+
+            current = self.broker.getvalue(datas=[data])
+            price = kwargs.get("price")
+            price = price if price is not None else data.close[0]
+            comminfo = self.broker.getcommissioninfo(data)
+            if target > current:
+                buys.append((self.buy, data, {"size": comminfo.getsize(price, target - current), "price": price}))
+            elif target < current:
+                sells.append((self.sell, data, {"size": comminfo.getsize(price, current - target), "price": price}))
+
+        return [submit(data=data, **{**kwargs, **args}) for submit, data, args in sells + buys]
@@ -0,0 +1,188 @@
+""" Shared OHLCV panel.
+
+All tickers are kept in a single dates x symbols x fields float array backed by `numpy.memmap`.
+The panel is built once and then opened read-only by any number of backtest processes,
+which share the same pages through the OS page cache instead of holding their own copies.
+
+A panel directory holds one version per distinct data, named by its fingerprint, and a `current` symlink to the
+latest one. `open_or_build` opens the current version when the data hasn't changed and writes a new version
+otherwise. Versions are never modified in place and the symlink is swapped atomically, so concurrent builds and
+processes holding an older version open are safe.
+
+    panel = OHLCVPanel.open_or_build(get_data(symbols=universe), os.path.join(FINSTRATB_HOME, "panels", "sectors"))
+"""
+
+import json
+import os
+import shutil
+import uuid
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from finstratb.misc.disk_cache import fingerprint
+
+FIELDS = ["volume", "open", "high", "low", "close"]
+
+_VALUES_FILE = "values.dat"
+_DATES_FILE = "dates.npy"
+_META_FILE = "meta.json"
+_CURRENT_LINK = "current"
+_KEEP_VERSIONS = 2  # the current version and the one before, which running processes may still be opening
+
+
+class OHLCVPanel:
+    """Read-only dates x symbols x fields panel, every symbol is exposed as a view without copying."""
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): panel directory (its current version is opened) or a version directory
+        """
+        if not os.path.exists(os.path.join(path, _META_FILE)):
+            path = os.path.realpath(os.path.join(path, _CURRENT_LINK))
+        self.path = path
+        with open(os.path.join(path, _META_FILE)) as f:
+            meta = json.load(f)
+
+        self.symbols: List[str] = meta["symbols"]
+        self.fields: List[str] = meta["fields"]
+        self.digest: Optional[str] = meta.get("digest")
+        self.dates = pd.DatetimeIndex(np.load(os.path.join(path, _DATES_FILE)), name="date")
+        self.values = np.memmap(
+            os.path.join(path, _VALUES_FILE),
+            dtype=np.float64,
+            mode="r",
+            shape=(len(self.dates), len(self.symbols), len(self.fields)),
+        )
+        self._symbol_idx = {s: i for i, s in enumerate(self.symbols)}
+
+    @staticmethod
+    def fingerprint(data: Dict[str, pd.DataFrame]) -> str:
+        """Digest of the symbols (in order) and their OHLCV values, names the panel version"""
+        return fingerprint("ohlcv_panel", FIELDS, *(part for s, df in data.items() for part in (s, df[FIELDS])))
+
+    @classmethod
+    def open_or_build(cls, data: Dict[str, pd.DataFrame], path: str) -> "OHLCVPanel":
+        """Opens the panel at `path` if it holds exactly `data`, builds a new version otherwise"""
+        digest = cls.fingerprint(data)
+        version_path = os.path.join(path, digest)
+        if os.path.exists(os.path.join(version_path, _META_FILE)):
+            logger.info(f"Using OHLCV panel {version_path}")
+            cls._point_to(path, digest)
+            return cls(version_path)
+        return cls.build(data, path, digest=digest)
+
+    @classmethod
+    def build(cls, data: Dict[str, pd.DataFrame], path: str, digest: Optional[str] = None) -> "OHLCVPanel":
+        """Writes the per-symbol frames (as returned by `get_data`) as a new version of the panel at `path`.
+
+        Dates missing for a symbol are stored as NaN. The version is written next to its final directory and
+        renamed in place at the end, so processes opening it never see a partially written panel.
+        """
+        digest = digest or cls.fingerprint(data)
+        symbols = list(data.keys())
+        dates = pd.DatetimeIndex(sorted(set().union(*(d.index for d in data.values()))))
+        logger.info(f"Building OHLCV panel: {len(dates)} dates x {len(symbols)} symbols...")
+
+        version_path = os.path.join(path, digest)
+        tmp_path = f"{version_path}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(tmp_path)
+
+        values = np.memmap(
+            os.path.join(tmp_path, _VALUES_FILE),
+            dtype=np.float64,
+            mode="w+",
+            shape=(len(dates), len(symbols), len(FIELDS)),
+        )
+        values[:] = np.nan
+        for i, s in enumerate(symbols):
+            rows = dates.get_indexer(data[s].index)
+            values[rows, i, :] = data[s][FIELDS].to_numpy(dtype=np.float64)
+        values.flush()
+        del values
+
+        np.save(os.path.join(tmp_path, _DATES_FILE), dates.values)
+        with open(os.path.join(tmp_path, _META_FILE), "w") as f:
+            json.dump({"symbols": symbols, "fields": FIELDS, "digest": digest}, f)
+
+        try:
+            os.rename(tmp_path, version_path)
+        except OSError:  # built by a concurrent process meanwhile, same content
+            if not os.path.exists(os.path.join(version_path, _META_FILE)):
+                raise
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        cls._point_to(path, digest)
+        cls._prune(path)
+        return cls(version_path)
+
+    @staticmethod
+    def _point_to(path: str, digest: str) -> None:
+        # Symlink under a unique name renamed over the current one, the switch is atomic for readers
+        link = os.path.join(path, _CURRENT_LINK)
+        if os.path.islink(link) and os.readlink(link) == digest:
+            return
+        tmp_link = f"{link}.{uuid.uuid4().hex}.tmp"
+        os.symlink(digest, tmp_link)
+        os.replace(tmp_link, link)
+
+    @staticmethod
+    def _prune(path: str) -> None:
+        """Removes all but the most recent versions, panels already opened keep their mapped pages"""
+        versions = []
+        for name in os.listdir(path):
+            meta = os.path.join(path, name, _META_FILE)
+            if name.endswith(".tmp") or os.path.islink(os.path.join(path, name)) or not os.path.exists(meta):
+                continue
+            try:
+                versions.append((os.path.getmtime(meta), name))
+            except FileNotFoundError:  # pruned by another process
+                continue
+
+        current = os.readlink(os.path.join(path, _CURRENT_LINK))
+        stale = [name for _, name in sorted(versions, reverse=True) if name != current][_KEEP_VERSIONS - 1 :]
+        for name in stale:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._symbol_idx
+
+    def __getitem__(self, symbol: str) -> np.ndarray:
+        """Read-only dates x fields view for the symbol"""
+        return self.values[:, self._symbol_idx[symbol], :]
+
+    def frame(self, symbol: str) -> pd.DataFrame:
+        """Symbol's history as a DataFrame over the panel memory.
+
+        Rows before the first and after the last bar of the symbol are sliced away, which keeps the frame a view.
+        Only if the symbol has gaps inside its history the missing rows are dropped, which copies the data.
+        """
+        values = self[symbol]
+        valid = ~np.isnan(values[:, self.fields.index("close")])
+        rows = np.flatnonzero(valid)
+        if len(rows) == 0:
+            return pd.DataFrame(columns=self.fields, index=self.dates[:0])
+
+        start, end = rows[0], rows[-1] + 1
+        values, index = values[start:end], self.dates[start:end]
+        if len(rows) < end - start:
+            mask = valid[start:end]
+            values, index = values[mask], index[mask]
+        return pd.DataFrame(values, index=index, columns=self.fields, copy=False)
+
+    def to_dict(self) -> Dict[str, pd.DataFrame]:
+        """Same layout as `get_data` returns, backed by the shared panel"""
+        return {s: self.frame(s) for s in self.symbols}
+
+
+if __name__ == "__main__":
+    from finstratb.misc.helpers import get_data
+    from finstratb.misc.price_store import FINSTRATB_HOME
+
+    panel = OHLCVPanel.open_or_build(
+        get_data(symbols=["SPY", "QQQ", "GLD"]), os.path.join(FINSTRATB_HOME, "panels", "example")
+    )
+    print(panel.frame("QQQ").tail())
@@ -0,0 +1,70 @@
+""" Open positions of a strategy, maintained from its order notifications.
+
+`[d for d, pos in self.getpositions().items() if pos]` walks the broker's position of every data feed.
+`PositionIndexMixin` keeps the feeds with an open position in `self.position_index` instead, updated only when
+an order of the feed is executed, so reading the held feeds costs O(held positions) regardless of the universe.
+
+    class Strategy(PositionIndexMixin, bt.Strategy):
+        def next(self):
+            for d in self.position_index.held():
+                ...
+"""
+
+from typing import List, Sequence
+
+import backtrader as bt
+
+
+class PositionIndex:
+    """Feeds with an open position, in the order of the strategy's datas"""
+
+    def __init__(self, datas: Sequence[bt.DataBase]) -> None:
+        self._rank = {d: i for i, d in enumerate(datas)}
+        self._held = set()
+        self._sorted: List[bt.DataBase] = []
+
+    def update(self, data: bt.DataBase, size: float) -> None:
+        """Records the position size of the feed after an execution"""
+        if size:
+            if data in self._held:
+                return
+            self._held.add(data)
+        elif data in self._held:
+            self._held.remove(data)
+        else:
+            return
+        self._sorted = sorted(self._held, key=self._rank.__getitem__)
+
+    def held(self) -> List[bt.DataBase]:
+        """Feeds with an open position (a new list, safe to keep while orders are placed)"""
+        return list(self._sorted)
+
+    def __contains__(self, data: bt.DataBase) -> bool:
+        return data in self._held
+
+    def __len__(self) -> int:
+        return len(self._held)
+
+    def __iter__(self):
+        return iter(self.held())
+
+
+class PositionIndexMixin:
+    """Strategy mixin maintaining `self.position_index`.
+
+    The index is updated when the broker hands an execution to the strategy, before timers fire and before
+    `notify_order` is delivered, so `notify_timer`, `next` and `notify_order` all see the same positions
+    as `getpositions()`.
+    """
+
+    @property
+    def position_index(self) -> PositionIndex:
+        index = self.__dict__.get("_position_index")
+        if index is None:
+            index = self._position_index = PositionIndex(self.datas)
+        return index
+
+    def _addnotification(self, order, quicknotify=False):
+        if order.status in (order.Partial, order.Completed):
+            self.position_index.update(order.data, self.getposition(order.data).size)
+        super()._addnotification(order, quicknotify=quicknotify)
@@ -0,0 +1,77 @@
+""" Local on-disk price store.
+
+Keeps one columnar (Parquet) file per symbol, so that repeated backtest runs read the history from disk
+and only fetch the bars that were added since the last run.
+"""
+
+import os
+from typing import Optional
+
+import pandas as pd
+from loguru import logger
+
+FINSTRATB_HOME = os.environ.get("FINSTRATB_HOME", os.path.join(os.path.expanduser("~"), ".finstratb"))
+DEFAULT_STORE_DIR = os.path.join(FINSTRATB_HOME, "prices")
+
+PRICE_COLUMNS = ["volume", "open", "high", "low", "close"]
+
+
+class PriceStore:
+    """Stores daily OHLCV history as one Parquet file per symbol, indexed by date."""
+
+    def __init__(self, root: str = DEFAULT_STORE_DIR) -> None:
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, symbol: str) -> str:
+        # Tickers like BRK-B or ^VIX are kept as is, only path separators are replaced
+        return os.path.join(self.root, f"{symbol.replace(os.sep, '_')}.parquet")
+
+    def __contains__(self, symbol: str) -> bool:
+        return os.path.exists(self.path(symbol))
+
+    def read(self, symbol: str) -> Optional[pd.DataFrame]:
+        """Reads the full history of the symbol, None if the symbol isn't stored yet."""
+        if symbol not in self:
+            return None
+        return pd.read_parquet(self.path(symbol))
+
+    def last_date(self, symbol: str) -> Optional[pd.Timestamp]:
+        """Date of the last stored bar. Only the date column is read from disk."""
+        if symbol not in self:
+            return None
+        dates = pd.read_parquet(self.path(symbol), columns=[]).index
+        return dates[-1] if len(dates) else None
+
+    def synced_at(self, symbol: str) -> Optional[pd.Timestamp]:
+        """Time the symbol was last written or marked as synced, in UTC. None if the symbol isn't stored yet."""
+        if symbol not in self:
+            return None
+        return pd.Timestamp(os.path.getmtime(self.path(symbol)), unit="s", tz="UTC")
+
+    def touch(self, symbol: str) -> None:
+        """Marks the stored symbol as synced without rewriting it."""
+        os.utime(self.path(symbol))
+
+    def write(self, symbol: str, data: pd.DataFrame) -> pd.DataFrame:
+        """Replaces the stored history of the symbol.
+
+        The file is written to a temporary location first and then moved in place,
+        so a concurrent reader never sees a partially written file.
+        """
+        data = data.loc[:, PRICE_COLUMNS].sort_index()
+        data.index.name = "date"
+        tmp_path = f"{self.path(symbol)}.{os.getpid()}.tmp"
+        data.to_parquet(tmp_path)
+        os.replace(tmp_path, self.path(symbol))
+        return data
+
+    def append(self, symbol: str, data: pd.DataFrame) -> pd.DataFrame:
+        """Appends new bars to the stored history. Bars for already stored dates are overwritten."""
+        stored = self.read(symbol)
+        if stored is not None:
+            data = pd.concat([stored, data.loc[:, PRICE_COLUMNS]])
+            data = data[~data.index.duplicated(keep="last")]
+        data = self.write(symbol, data)
+        logger.debug(f"Stored {symbol} up to {data.index.max():%Y-%m-%d}")
+        return data
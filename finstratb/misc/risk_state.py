@@ -0,0 +1,64 @@
+""" Per-asset risk state of a strategy in numpy arrays.
+
+Entry prices, trailing highs and the days since the trailing high are kept in arrays indexed by the asset id
+(position of the feed in the strategy's datas). The daily checks of all held assets, trailing-high update,
+profit take and ATR trailing stop, are one vector operation each.
+
+    risk = RiskState(self.datas, max_days_from_high=6)
+    risk.enter(d, d.close[0])
+    ids = risk.ids(held)
+    risk.update_trailing(ids, closes)
+    take = risk.profit_take(ids, closes, 0.35)
+    stop = risk.trailing_stop(ids, closes, atr, factor=1)
+"""
+
+from typing import Sequence
+
+import backtrader as bt
+import numpy as np
+
+
+class RiskState:
+    def __init__(self, datas: Sequence[bt.DataBase], max_days_from_high: int) -> None:
+        """
+        Args:
+            datas (Sequence[bt.DataBase]): feeds of the strategy, the position of a feed is its asset id
+            max_days_from_high (int): upper limit of the days since the trailing high
+        """
+        self._ids = {d: i for i, d in enumerate(datas)}
+        self.max_days_from_high = max_days_from_high
+        # NaN until the asset is entered, a new entry resets the prices (the days count carries over)
+        self.buy_price = np.full(len(datas), np.nan)
+        self.trailing_price = np.full(len(datas), np.nan)
+        self.days_since_high = np.zeros(len(datas), dtype=np.int64)  # 0 until first held
+
+    def ids(self, datas: Sequence[bt.DataBase]) -> np.ndarray:
+        return np.fromiter((self._ids[d] for d in datas), dtype=np.intp, count=len(datas))
+
+    def enter(self, data: bt.DataBase, price: float) -> None:
+        """Sets the entry price and the trailing high of a new (or rebalanced) position"""
+        i = self._ids[data]
+        self.buy_price[i] = price
+        self.trailing_price[i] = price
+
+    def update_trailing(self, ids: np.ndarray, closes: np.ndarray) -> None:
+        """Moves the trailing highs to new highs and counts the days since the high, capped at max_days_from_high"""
+        days = self.days_since_high[ids]
+        days[days == 0] = 1
+        new_high = closes >= self.trailing_price[ids]
+        self.trailing_price[ids] = np.where(new_high, closes, self.trailing_price[ids])
+        self.days_since_high[ids] = np.where(new_high, 1, np.minimum(self.max_days_from_high, days + 1))
+
+    def profit_take(self, ids: np.ndarray, closes: np.ndarray, pct: float) -> np.ndarray:
+        """Mask of the assets with a gain over pct since the entry"""
+        with np.errstate(invalid="ignore"):
+            return closes / self.buy_price[ids] - 1.0 > pct
+
+    def stop_level(self, ids: np.ndarray, atr: np.ndarray, factor: float) -> np.ndarray:
+        """Trailing high less factor * ATR for every day since the high"""
+        return self.trailing_price[ids] - factor * atr * self.days_since_high[ids]
+
+    def trailing_stop(self, ids: np.ndarray, closes: np.ndarray, atr: np.ndarray, factor: float) -> np.ndarray:
+        """Mask of the assets closing below their ATR trailing stop"""
+        with np.errstate(invalid="ignore"):
+            return closes < self.stop_level(ids, atr, factor)
@@ -0,0 +1,113 @@
+""" Momentum signals as dense dates x tickers matrices.
+
+Every momentum definition is exposed through the interface of `IdiosyncMomentum`: `momentum_matrix`,
+`get_cross_section(date)` and `get_momentum(ticker, date)`. The matrix is computed once for the whole universe
+and cached, so a strategy reads the cross-section at a bar with one binary search and one row read, and
+definitions can be swapped through a strategy parameter without changing its code.
+
+    signal = TrendSignal(data_dict, periods=(30, 90, 250), weights=(1, 2, 1))
+    signal = IdiosyncSignal(IdiosyncMomentum(data_dict))
+    momentum = signal.get_cross_section(current_date)
+"""
+
+import datetime as dt
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from finstratb.misc.mom_idiosync import AdaptiveIdiosyncMomentum, IdiosyncMomentum, as_of_row
+from finstratb.misc.momentum import BlockPrefixSums, rolling_trend
+
+
+class Signal(ABC):
+    """Base class of the signals, subclasses implement `_compute`"""
+
+    def __init__(self) -> None:
+        self._matrix: Optional[pd.DataFrame] = None
+
+    @abstractmethod
+    def _compute(self) -> pd.DataFrame:
+        """Dates x tickers matrix of the signal, as-of values (forward filled over the union of the dates)"""
+
+    @property
+    def momentum_matrix(self) -> pd.DataFrame:
+        if self._matrix is None:
+            self._matrix = self._compute().sort_index()
+            self._dates = self._matrix.index.values
+            self._values = self._matrix.values
+            self._ticker_col = {t: i for i, t in enumerate(self._matrix.columns)}
+        return self._matrix
+
+    def get_cross_section(self, date: Union[str, dt.datetime]) -> pd.Series:
+        """Signal of all tickers as of the date (latest value not beyond the date), NaN where not available"""
+        matrix = self.momentum_matrix
+        row = as_of_row(self._dates, date)
+        if row < 0:
+            return pd.Series(np.nan, index=matrix.columns)
+        return pd.Series(self._values[row], index=matrix.columns)
+
+    def get_momentum(self, ticker: str, date: Union[str, dt.datetime]) -> float:
+        """Signal of the ticker as of the date, NaN where not available
+
+        Raises:
+            KeyError: if the ticker isn't in the signal
+        """
+        self.momentum_matrix  # computed on first use
+        if ticker not in self._ticker_col:
+            raise KeyError(f"Data for {ticker} doesn't exist")
+        row = as_of_row(self._dates, date)
+        return self._values[row, self._ticker_col[ticker]] if row >= 0 else np.nan
+
+
+class TrendSignal(Signal):
+    """`Momentum` indicator values (annualized trend of log prices scaled by |r|) of every ticker and trading day.
+
+    With several periods the signal is their weighted average, like the blend of `multi_momentum`.
+    """
+
+    def __init__(
+        self,
+        ticker_data: Dict[str, pd.DataFrame],
+        periods: Union[int, Sequence[int]] = 90,
+        weights: Optional[Sequence[float]] = None,
+    ) -> None:
+        """
+        Args:
+            ticker_data (Dict[str, pd.DataFrame]): ticker -> daily prices with a close column
+            periods (Union[int, Sequence[int]], optional): trend window(s) in bars. Defaults to 90.
+            weights (Optional[Sequence[float]], optional): weights of the periods, equal by default
+        """
+        super().__init__()
+        self.ticker_data = ticker_data
+        self.periods = (periods,) if isinstance(periods, int) else tuple(periods)
+        weights = np.ones(len(self.periods)) if weights is None else np.asarray(weights, dtype=np.float64)
+        if len(weights) != len(self.periods):
+            raise ValueError(f"Got {len(weights)} weights for {len(self.periods)} periods")
+        self.weights = weights / weights.sum()
+
+    def _trend(self, close: pd.Series) -> pd.Series:
+        log_prices = np.log(close.to_numpy(dtype=np.float64))
+        sums = BlockPrefixSums(log_prices, max(self.periods))
+        trend = sum(w * rolling_trend(log_prices, p, sums) for w, p in zip(self.weights, self.periods))
+        return pd.Series(trend, index=close.index)
+
+    def _compute(self) -> pd.DataFrame:
+        trends = {t: self._trend(df["close"]) for t, df in self.ticker_data.items()}
+        if not trends:
+            return pd.DataFrame()
+        dates = pd.DatetimeIndex(np.unique(np.concatenate([s.index.values for s in trends.values()])))
+        # As-of alignment, a ticker's last value holds over other tickers' trading days
+        return pd.DataFrame({t: s.reindex(dates, method="ffill") for t, s in trends.items()}, index=dates)
+
+
+class IdiosyncSignal(Signal):
+    """Idiosyncratic momentum (single or adaptive) as a signal, month-end values"""
+
+    def __init__(self, momentum: Union[IdiosyncMomentum, AdaptiveIdiosyncMomentum]) -> None:
+        super().__init__()
+        self.momentum = momentum
+
+    def _compute(self) -> pd.DataFrame:
+        return self.momentum.momentum_matrix
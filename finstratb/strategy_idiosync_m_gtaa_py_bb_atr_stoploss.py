@@ -11,6 +11,7 @@ from typing import List, Dict
 import pandas as pd
 import backtrader as bt
 import datetime
+import os
 
 from universe_11 import (
     EXTENDED_UNIVERSE,
@@ -32,7 +33,16 @@ from finstratb.misc.helpers import (
     get_single_ticker_data_from_file,
 )
 from finstratb.misc.mom_idiosync import IdiosyncMomentum
+from finstratb.misc.disk_cache import DiskCache
 from finstratb.misc.positioning import PyramidPositioning, EmptyPositionQueueException
+from finstratb.misc.position_index import PositionIndexMixin
+from finstratb.misc.orders import TargetWeightsMixin
+from finstratb.misc.risk_state import RiskState
+from finstratb.misc.feeds import add_data_feeds
+from finstratb.misc.indicator_store import IndicatorStore, feed_lines, line_names
+from finstratb.misc.broker import FastBroker
+from finstratb.misc.panel import OHLCVPanel
+from finstratb.misc.price_store import FINSTRATB_HOME
 import collections
 import quantstats
 
@@ -65,7 +75,7 @@ class BuyAndHold_1(bt.Strategy):
             self.order_target_percent(d, target=1.0 / len(all_valid_etfs))
 
 
-class Strategy(bt.Strategy):
+class Strategy(PositionIndexMixin, TargetWeightsMixin, bt.Strategy):
     params = dict(
         momentum_instance = None, 
       #   momentum=IdiosyncMomentum,  # parametrize the momentum and its period
@@ -113,25 +123,32 @@ class Strategy(bt.Strategy):
         self.d_with_len = self.stocks
         self.buy_positions = []
         self.rebalance_sell_date = None
-        self.buy_price = {}
-        self.trailing_price = {}
         self.skip_hedge = False
         self.is_downtrend = False
         self.positioning_queue = {}
         self.open_orders = {}
-        self.atr_days_since_high = {}
+        self.risk = RiskState(self.datas, max_days_from_high=self.p.atr_max_days_from_high)
 
         for d in self.stocks:
             # self.inds[d]["long_momentum"] = self.p.momentum(
             #     d, period=self.p.long_momentum_period
             # )
-            self.inds[d]["sma200"] = bt.indicators.EMA(
+            # Lines precomputed by IndicatorStore are read from the feed, indicators are only built without them
+            ema = feed_lines(d, "ema", period=self.p.ticker_uptrend_ma)
+            self.inds[d]["sma200"] = ema[0] if ema else bt.indicators.EMA(
                 d.close, period=self.p.ticker_uptrend_ma)
-            self.inds[d]['bband'] = bt.indicators.BBands(
-                d.close, period=self.p.bbands_period, devfactor=self.p.bbands_devfactor)
-            
-            self.inds[d]['atr'] = bt.indicators.ATR(d, period = 90)
-            self.inds[d]["pct_change1"] = bt.indicators.PercentChange(
+
+            bband = feed_lines(d, "bbands", period=self.p.bbands_period, devfactor=self.p.bbands_devfactor)
+            if not bband:
+                ind = bt.indicators.BBands(
+                    d.close, period=self.p.bbands_period, devfactor=self.p.bbands_devfactor)
+                bband = [ind.lines.mid, ind.lines.top, ind.lines.bot]
+            self.inds[d]['bband_mid'], _, self.inds[d]['bband_bot'] = bband
+
+            atr = feed_lines(d, "atr", period=90)
+            self.inds[d]['atr'] = atr[0] if atr else bt.indicators.ATR(d, period = 90)
+            pct_change = feed_lines(d, "pct_change", period=1)
+            self.inds[d]["pct_change1"] = pct_change[0] if pct_change else bt.indicators.PercentChange(
                 d.close, period=1)
 
         self.add_timer(
@@ -186,17 +203,18 @@ class Strategy(bt.Strategy):
         # This code is executed if SPY < SMA(SPY)
         self.is_downtrend = True
 
-        posdata = [d for d, pos in self.getpositions().items() if pos]
+        posdata = self.position_index.held()
       #  safe_assets = [d for d in self.safe_assets if d not in posdata]
 
         # parent_order = None
+        targets = {}
         for d in posdata:
             # if ( d.close[-1] < self.inds[d]["sma200"][-1]):  # -1 since we are using COC for buy orders. For sell orders we want to execute based on yesterday's data
             if d not in self.safe_assets:
                 self.log(
                     f"RISK MANAGEMENT: US MARKET IS IN DOWNTREND, EXITING POSITING for {d._name}, price used for check: {d[-1]:.2f}"
                 )
-                self.close(d)
+                targets[d] = 0.0
                 self.positioning_queue.pop(d, None)
 
 #        if safe_assets:
@@ -204,13 +222,14 @@ class Strategy(bt.Strategy):
         self.downtrend = 1
 
         for d in self.safe_assets:
-            self.order_target_percent(
-                d, target=self.safe_asset_weights[d._name])
+            targets[d] = self.safe_asset_weights[d._name]
 
             # self.positioning_queue[d] =  PyramidPositioning(d, asset_initial_price=d.close[0], asset_total_target_pct=self.safe_asset_weights[d._name],
             #                                                 step_pct_increase=self.p.pyramid_step_pct_increase, n_steps = self.p.pyramid_n_steps)
-            self.buy_price[d] = d.close[0]
-            self.trailing_price[d] = d.close[0]
+            self.risk.enter(d, d.close[0])
+
+        # One valuation of the portfolio for the whole basket, exits are submitted before the safe asset buys
+        self.order_target_weights(targets)
 
     def purchase_assets_in_queue(self):
         """Function responsible for entering positions
@@ -224,10 +243,10 @@ class Strategy(bt.Strategy):
                 current_price = d[0]
                 try:
 
-                    # if position.delay_buy and (current_price <= self.inds[d]["bband"].lines.bot[-1] or current_price >= self.inds[d]["bband"].lines.mid[-1]):
+                    # if position.delay_buy and (current_price <= self.inds[d]["bband_bot"][-1] or current_price >= self.inds[d]["bband_mid"][-1]):
                     # If price was in downtrend according to BB and price touched the bottom limit, allow to buy
                     # If price was in downtend but crossed back to uptrend without reaching bottom, proceed with pyramid...
-                    if position.delay_buy and ((current_price <= self.inds[d]["bband"].lines.bot[-1]) or (current_price >= self.inds[d]["bband"].lines.mid[-1])):
+                    if position.delay_buy and ((current_price <= self.inds[d]["bband_bot"][-1]) or (current_price >= self.inds[d]["bband_mid"][-1])):
                         position.delay_buy = False
                         self.log(
                             f"\t\tBollinger Band reached bottom. Updating target price: {d._name}: Price: {d[0]:.2f}")
@@ -247,7 +266,7 @@ class Strategy(bt.Strategy):
                                 f"\t\tPosition Ordering: {d._name}: Price: {d[0]:.2f}, Weight: {pct_allocation:.2f}")
                         
                         # 2022/02/18 - if no allocation and price is touching lower band again, update the target price
-                        elif (current_price <= self.inds[d]["bband"].lines.bot[-1]):
+                        elif (current_price <= self.inds[d]["bband_bot"][-1]):
                             position.update_target_price(
                                 current_price=position.asset_target_price)
                             
@@ -263,44 +282,43 @@ class Strategy(bt.Strategy):
 
         self.purchase_assets_in_queue()
 
-        posdata = [d for d, pos in self.getpositions().items() if pos]
+        posdata = self.position_index.held()
 
         # if self.downtrend:
         #     return
-        for d in posdata:
-            self.atr_days_since_high.setdefault(d, 1)
+        if not posdata:
+            return
 
-            if (
-                d.close[-1] >= self.trailing_price[d]
-            ):  # this is required for max drawdown calculation for trailing stop loss
-                self.trailing_price[d] = d.close[-1]
-                self.atr_days_since_high[d] = 1
-            else:
-                self.atr_days_since_high[d]+=1
-                self.atr_days_since_high[d] = min(self.p.atr_max_days_from_high, self.atr_days_since_high[d]) # limit by n days
+        # Risk state of all held assets in one vector operation per check
+        ids = self.risk.ids(posdata)
+        closes = np.array([d.close[-1] for d in posdata])
+        atr = np.array([self.inds[d]['atr'][-1] for d in posdata])
+        self.risk.update_trailing(ids, closes)  # this is required for max drawdown calculation for trailing stop loss
+        can_close = np.array([d not in self.open_orders for d in posdata])
+        in_queue = np.array([d in self.positioning_queue for d in posdata])
+        profit_take = can_close & self.risk.profit_take(ids, closes, self.p.profit_take_pct)
+        stop_loss = (
+            can_close & ~in_queue & ~profit_take
+            & self.risk.trailing_stop(ids, closes, atr, self.p.atr_factor_trailing_stop)
+        )
 
-            if d in self.buy_price and (d not in self.open_orders) and (
-                d.close[-1] / self.buy_price[d] - 1.0 > self.p.profit_take_pct
-            ):
+        for k in np.flatnonzero(profit_take | stop_loss):
+            d = posdata[k]
+            if profit_take[k]:
                 self.log(
                     f"RISK MANAGEMENT: TRAILING PROFIT TAKE for {d._name}, price: {d[-1]:.2f}"
                 )
-                self.close(d)
-                self.positioning_queue.pop(d, None)
-                continue
-            #print(f"ATR: {self.inds[d]['atr'][-1]}")
-            if d in self.trailing_price and (d not in self.open_orders) and (d.close[-1] <  self.trailing_price[d] - self.p.atr_factor_trailing_stop*self.inds[d]['atr'][-1]*self.atr_days_since_high[d]) and (d not in self.positioning_queue):
-            #if (d.close[-1] <  d.close[-2] - self.p.atr_factor_trailing_stop * self.inds[d]['atr'][-2]):
+            else:
+                i = ids[k]
                 self.log(
-                    f"RISK MANAGEMENT: ATR TRAILING STOP LOSS for {d._name}, price: {d[-1]:.2f}, ATR days high: {self.atr_days_since_high[d]}, trailing high: {self.trailing_price[d]:.2f}, ATR: {self.p.atr_factor_trailing_stop * self.inds[d]['atr'][-1]:.2f}")
-                self.close(d)
-                self.positioning_queue.pop(d, None)
-                continue
+                    f"RISK MANAGEMENT: ATR TRAILING STOP LOSS for {d._name}, price: {d[-1]:.2f}, ATR days high: {self.risk.days_since_high[i]}, trailing high: {self.risk.trailing_price[i]:.2f}, ATR: {self.p.atr_factor_trailing_stop * atr[k]:.2f}")
+            self.close(d)
+            self.positioning_queue.pop(d, None)
 
     def rebalance_portfolio(self, recovery_mode=False):
         # only look at data that we can have indicators for
         # Get current positions
-        posdata = [d for d, pos in self.getpositions().items() if pos]
+        posdata = self.position_index.held()
 
         if self.spy.close[-1] < self.spy_sma200[-1] and not recovery_mode:
             self.log("NO REBALANCING DUE TO MARKET DOWNTREND")
@@ -312,6 +330,8 @@ class Strategy(bt.Strategy):
         
         current_date = bt.num2date(self.data.datetime[0])
 
+        # As-of momentum of the whole universe, looked up once per rebalance
+        momentum = self.p.momentum_instance.get_cross_section(current_date).to_dict()
         
         # In recovery mode, exclude safe assets
         if recovery_mode:
@@ -319,7 +339,7 @@ class Strategy(bt.Strategy):
                 d for d in self.d_with_len 
                 if d.close[-1] >= self.inds[d]["sma200"][-1] and 
                 d not in self.safe_assets and 
-                self.p.momentum_instance.get_momentum(d._name, current_date) >=0
+                momentum[d._name] >=0
             ]
 
         else:
@@ -328,12 +348,12 @@ class Strategy(bt.Strategy):
                 d for d in self.d_with_len 
                 if d.close[-1] >= self.inds[d]["sma200"][-1] and 
             #    d not in self.safe_assets and 
-                self.p.momentum_instance.get_momentum(d._name, current_date) >= 0
+                momentum[d._name] >= 0
                 ]
             
 
         top_long_momentums = sorted(
-            all_valid_etfs, key=lambda d: self.p.momentum_instance.get_momentum(d._name, current_date), reverse=True
+            all_valid_etfs, key=lambda d: momentum[d._name], reverse=True
         )[: self.p.max_stocks+2] # +2 is only for display purposes
         
         # top_long_momentums = sorted(
@@ -341,7 +361,7 @@ class Strategy(bt.Strategy):
         # )[: self.p.max_stocks+2]
 
         momentum_values = [
-            f"{d._name}:{self.p.momentum_instance.get_momentum(d._name, current_date):.3f}" for d in top_long_momentums]
+            f"{d._name}:{momentum[d._name]:.3f}" for d in top_long_momentums]
 
         print(f"MOMENTUM VALUES: {', '.join(momentum_values)}")
         # top_long_momentums = [d for d in top_long_momentums if d not in negative_short_momentums][:self.p.max_stocks]
@@ -349,9 +369,10 @@ class Strategy(bt.Strategy):
         self.buy_positions = top_long_momentums[:self.p.max_stocks]
 
         sell_positions = [d for d in posdata if d not in self.buy_positions]
+        targets = {}
         for d in sell_positions:
             self.log(f"Exiting position: {d._name}: {d[0]:.2f}")
-            self.order_target_percent(d, target=0.0)
+            targets[d] = 0.0
 
         # Reseet positioning queue
         self.positioning_queue = {
@@ -385,18 +406,20 @@ class Strategy(bt.Strategy):
                                                              step_pct_increase=self.p.pyramid_step_pct_increase, n_steps=self.p.pyramid_n_steps)
 
                     # stock is in downtrend, delay purchase till BB reaches the bottom
-                    if d.close[0] <= self.inds[d]["bband"].lines.mid[-1]:
+                    if d.close[0] <= self.inds[d]["bband_mid"][-1]:
                         position_allocation.delay_buy = True
 
                     self.positioning_queue[d] = position_allocation
-                    self.buy_price[d] = d.close[0]
-                    self.trailing_price[d] = d.close[0]
+                    self.risk.enter(d, d.close[0])
 
                 elif d not in self.positioning_queue:  # just rebalance if asset is fully positioned
 
-                    o = self.order_target_percent(d, target=0.95 * w)
+                    targets[d] = 0.95 * w
                 #self.buy_price[d] = d.close[0]
                 #self.trailing_price[d] = d.close[0]
+
+        # Exits and rebalancing of fully positioned assets as one basket, sells first
+        self.order_target_weights(targets)
                 
     def get_erc_weights(self, buy_positions) -> list:
         try:
@@ -449,7 +472,6 @@ class Strategy(bt.Strategy):
                 self.log(
                     f"\tORDER COMPLETED: SELL {order.data._name}, price: {order.executed.price:.2f}, shares: {order.size}, value: ${order.executed.price*order.size:.2f}"
                 )
-            posdata = [d for d, pos in self.getpositions().items() if pos]
         #    self.open_orders.pop(order.data._name, None)
             self.bar_executed = len(self)
 
@@ -478,6 +500,7 @@ if __name__ == "__main__":
     #universe = HFEA_UNIVERSE
     #universe = PBEAR
     cerebro = bt.Cerebro()
+    cerebro.broker = FastBroker()  # per-bar work over the open positions only, same fills as the default broker
     cerebro.broker.setcash(100000.0)
 
     # https://www.backtrader.com/docu/broker/ - see cheat-on-close, prevents buy/sell at the same bar
@@ -489,7 +512,11 @@ if __name__ == "__main__":
 
     cerebro.broker.set_checksubmit(checksubmit=False)
 
-    data_dict = get_data(symbols=["SPY"] + universe)
+    # All tickers live in one memory-mapped panel, rebuilt only when the prices changed. Parallel runs map the same pages
+    panel = OHLCVPanel.open_or_build(
+        get_data(symbols=["SPY"] + universe), os.path.join(FINSTRATB_HOME, "panels", "idiosync_m_gtaa")
+    )
+    data_dict = panel.to_dict()
     # from_date = datetime.datetime(1999, 12, 15)
     from_date = datetime.datetime(2005, 12, 15)
    # to_date = datetime.datetime(2020,2,17)
@@ -511,21 +538,25 @@ if __name__ == "__main__":
     #     )
     # )
     
-    imom = IdiosyncMomentum(ticker_data = data_dict)
-
-    for symbol, data in data_dict.items():
-        # print(data)
-        logger.info(f"Adding '{symbol}' to Cerebro.")
-
-        cerebro.adddata(
-            bt.feeds.PandasData(
-                dataname=data,
-                fromdate=from_date,
-                todate=to_date,
-                name=symbol,
-                plot=False,
-            )
-        )
+    imom = IdiosyncMomentum(ticker_data = data_dict, disk_cache=DiskCache())
+    imom.warm(panel_path=panel.path)  # compute momentum of all tickers in parallel before the first rebalance
+
+    logger.info(f"Adding {', '.join(data_dict)} to Cerebro.")
+    # Opt-in: per-ticker indicators of the default Strategy params computed once and read from the feeds.
+    # Faster, but results differ from the indicator path: the lines are warmed up on the full history and,
+    # inside notify_timer (rebalance, hedge), one bar ahead of the indicators (see finstratb.misc.indicator_store)
+    precompute_indicators = False
+    feed_data, feed_indicators = data_dict, []
+    if precompute_indicators:
+        feed_indicators = [
+            ("ema", {"period": 150}),
+            ("bbands", {"period": 20, "devfactor": 3}),
+            ("atr", {"period": 90}),
+            ("pct_change", {"period": 1}),
+        ]
+        feed_data = IndicatorStore().augment(data_dict, feed_indicators)
+    add_data_feeds(cerebro, feed_data, extra_lines=line_names(feed_indicators),
+                   fromdate=from_date, todate=to_date, plot=False)
 
     # print(data_dict)
 
@@ -36,6 +36,7 @@ from finstratb.misc.helpers import (
 )
 from finstratb.misc.momentum import Momentum
 from finstratb.misc.positioning import PyramidPositioning, EmptyPositionQueueException
+from finstratb.misc.feeds import add_data_feeds
 import collections
 import quantstats
 
@@ -478,19 +479,8 @@ if __name__ == "__main__":
     #     )
     # )
 
-    for symbol, data in data_dict.items():
-        # print(data)
-        logger.info(f"Adding '{symbol}' to Cerebro.")
-
-        cerebro.adddata(
-            bt.feeds.PandasData(
-                dataname=data,
-                fromdate=from_date,
-                todate=to_date,
-                name=symbol,
-                plot=False,
-            )
-        )
+    logger.info(f"Adding {', '.join(data_dict)} to Cerebro.")
+    add_data_feeds(cerebro, data_dict, fromdate=from_date, todate=to_date, plot=False)
 
     # print(data_dict)
 
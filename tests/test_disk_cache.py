@@ -0,0 +1,42 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from finstratb.misc import disk_cache
+from finstratb.misc.disk_cache import DiskCache
+
+
+def _entry(seed):
+    return pd.DataFrame({"x": np.random.default_rng(seed).normal(size=200)})
+
+
+def _cache_bytes(root):
+    return sum(os.path.getsize(p) for p in glob.glob(os.path.join(root, "*", "*.parquet")))
+
+
+def test_put_scans_only_when_the_limit_may_be_exceeded(tmp_path, monkeypatch):
+    scans = []
+    real_glob = disk_cache.glob.glob
+    monkeypatch.setattr(disk_cache.glob, "glob", lambda *a, **k: scans.append(a) or real_glob(*a, **k))
+
+    cache = DiskCache(str(tmp_path), max_bytes=10 * 1024**2)
+    for i in range(50):
+        cache.put(f"{i:064x}", _entry(i))
+    assert len(scans) == 1  # the first write
+    pd.testing.assert_frame_equal(cache.get(f"{7:064x}"), _entry(7))
+
+
+def test_evicts_least_recently_used(tmp_path):
+    probe = DiskCache(str(tmp_path / "probe"))
+    probe.put("0" * 64, _entry(0))
+    entry_bytes = _cache_bytes(probe.root)
+
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=int(5.5 * entry_bytes))
+    for i in range(20):
+        cache.put(f"{i:064x}", _entry(i))
+        assert _cache_bytes(cache.root) <= cache.max_bytes
+
+    assert cache.get(f"{19:064x}") is not None
+    assert cache.get(f"{1:064x}") is None
@@ -0,0 +1,251 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from finstratb.misc.disk_cache import DiskCache
+from finstratb.misc.factors import FactorFrame
+from finstratb.misc.mom_idiosync import (
+    AdaptiveIdiosyncMomentum,
+    AdaptiveParameters,
+    IdiosyncMomentum,
+    idiosync_momentum,
+    residual_momentum,
+    rolling_last_residuals,
+    rolling_online_residuals,
+    rolling_residuals,
+)
+from finstratb.misc.panel import OHLCVPanel
+
+
+def _prices(start, end="2021-06-15", seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(start, end, name="date")
+    close = 50 * np.exp(np.cumsum(rng.normal(0.0003, 0.015, len(index))))
+    return pd.DataFrame(
+        {"volume": 1e6, "open": close, "high": close * 1.01, "low": close * 0.99, "close": close}, index=index
+    )
+
+
+def _factors(start="1990-01-31", end="2021-12-31", freq="M", seed=1):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, end, freq=freq, name="date_ff_factors")
+    scale = 0.03 if freq == "M" else 0.01
+    factors = rng.normal(0, scale, (len(index), 3)) * [1, 0.5, 0.5]
+    return FactorFrame(pd.DataFrame(factors, index=index, columns=["Mkt-RF", "SMB", "HML"]))
+
+
+@pytest.fixture
+def ticker_data():
+    return {
+        "A": _prices("2000-01-03", seed=0),
+        "B": _prices("2004-05-03", seed=1),
+        "NEW": _prices("2021-06-01", seed=2),  # no completed month yet
+    }
+
+
+def test_momentum_matrix_has_every_ticker(ticker_data, monkeypatch):
+    computed = []
+    real_compute = IdiosyncMomentum._compute
+    monkeypatch.setattr(IdiosyncMomentum, "_compute", lambda self, t: computed.append(t) or real_compute(self, t))
+    for batch_universe in [True, False]:
+        computed.clear()
+        imom = IdiosyncMomentum(ticker_data, factor_provider=_factors(), batch_universe=batch_universe)
+        for _ in range(2):
+            with pytest.raises(IndexError):
+                imom.get_momentum("NEW", "2021-06-15")
+        assert computed == [["A", "B", "NEW"] if batch_universe else ["NEW"]]  # cached after the first call
+
+    imom = IdiosyncMomentum(ticker_data, factor_provider=_factors())
+    assert list(imom.momentum_matrix.columns) == ["A", "B", "NEW"]
+    cross_section = imom.get_cross_section("2021-06-15")
+    assert np.isnan(cross_section["NEW"])
+    assert not np.isnan(cross_section["A"])
+
+    adaptive = AdaptiveIdiosyncMomentum(
+        ticker_data, [AdaptiveParameters(24, 12), AdaptiveParameters(12, 6)], factor_provider=_factors()
+    )
+    assert list(adaptive.get_cross_section("2021-06-15").index) == ["A", "B", "NEW"]
+
+
+def test_disk_cache_round_trip(ticker_data, tmp_path, monkeypatch):
+    keys = []
+    real_disk_key = IdiosyncMomentum._disk_key
+    monkeypatch.setattr(IdiosyncMomentum, "_disk_key", lambda self, t: keys.append(t) or real_disk_key(self, t))
+
+    computed = IdiosyncMomentum(ticker_data, factor_provider=_factors(), disk_cache=DiskCache(str(tmp_path)))
+    computed.estimate_universe()
+    assert sorted(keys) == sorted(ticker_data)  # prices hashed once per ticker
+
+    estimated = []
+    real_estimate = IdiosyncMomentum._estimate_universe
+    monkeypatch.setattr(
+        IdiosyncMomentum, "_estimate_universe", lambda self, t: estimated.extend(t) or real_estimate(self, t)
+    )
+    loaded = IdiosyncMomentum(ticker_data, factor_provider=_factors(), disk_cache=DiskCache(str(tmp_path)))
+    pd.testing.assert_frame_equal(loaded.momentum_matrix, computed.momentum_matrix)
+    assert not estimated  # NEW's empty table is on disk as well
+
+
+def _per_ticker(imom, tickers):
+    return {t: imom._estimate_momentum(t) for t in tickers}
+
+
+def _assert_tables_match(batch, per_ticker):
+    assert batch.keys() == per_ticker.keys()
+    for t, table in per_ticker.items():
+        for column in ["residuals", "idiosync_momentum"]:
+            expected, actual = table[column], batch[t][column]
+            np.testing.assert_array_equal(np.isnan(actual.values), np.isnan(expected.values), err_msg=f"{t} {column}")
+            np.testing.assert_allclose(actual.values, expected.values, rtol=1e-9, atol=1e-12, err_msg=f"{t} {column}")
+
+
+def test_batch_matches_per_ticker_on_short_factor_history(ticker_data):
+    # Factors (without RF) start years after the prices, there is no momentum before the factor history
+    imom = IdiosyncMomentum(ticker_data, factor_provider=_factors(start="2008-01-31"))
+    tickers = ["A", "B"]
+    batch, per_ticker = imom._estimate_universe(tickers), _per_ticker(imom, tickers)
+    _assert_tables_match(batch, per_ticker)
+    assert batch["A"]["residuals"][:"2009-11-30"].isna().all()
+    assert batch["A"]["residuals"]["2009-12-31":].notna().all()
+
+
+@pytest.mark.parametrize("from_panel", [False, True])
+def test_warm_matches_estimate_universe(ticker_data, tmp_path, from_panel):
+    panel_path = None
+    if from_panel:
+        panel = OHLCVPanel.open_or_build(ticker_data, str(tmp_path / "panel"))
+        ticker_data, panel_path = panel.to_dict(), panel.path
+
+    factors = _factors(start="2008-01-31")
+    warmed = IdiosyncMomentum(ticker_data, factor_provider=factors)
+    timings = warmed.warm(n_workers=2, panel_path=panel_path)
+    assert len(timings) == 2
+
+    batch = IdiosyncMomentum(ticker_data, factor_provider=factors)
+    batch.estimate_universe()
+    _assert_tables_match(warmed._cache, batch._cache)
+
+
+def _statsmodels_reference(y, x, window):
+    """Last residual of every window from a statsmodels fit, NaN for windows with missing returns"""
+    reference = np.full(y.shape, np.nan)
+    for end in range(window - 1, len(y)):
+        rows = slice(end - window + 1, end + 1)
+        for stock in range(y.shape[1]):
+            if not np.isnan(y[rows, stock]).any():
+                reference[end, stock] = rolling_residuals(None, y[rows, stock], *x[rows].T)
+    return reference
+
+
+def _replay(imom, ticker, bars, chunk=3):
+    for lo in range(0, len(bars), chunk):
+        imom.update(ticker, bars.iloc[lo : lo + chunk])
+
+
+@pytest.mark.parametrize("batch_universe", [True, False])
+@pytest.mark.parametrize("frequency, windows, factors", [("M", (24, 12), "M"), ("W", (52, 26), "W-FRI")])
+def test_update_matches_full_recompute(ticker_data, batch_universe, frequency, windows, factors, monkeypatch):
+    split = "2020-10-01"  # replays more than eight months of bars
+    kwargs = dict(
+        rolling_window_coeff=windows[0],
+        rolling_window_mom=windows[1],
+        factor_provider=_factors(freq=factors),
+        batch_universe=batch_universe,
+        frequency=frequency,
+    )
+    imom = IdiosyncMomentum({t: df[df.index < split] for t, df in ticker_data.items()}, **kwargs)
+    imom.estimate_universe()
+    computed = []
+    real_compute = IdiosyncMomentum._compute
+    monkeypatch.setattr(IdiosyncMomentum, "_compute", lambda self, t: computed.extend(t) or real_compute(self, t))
+    for t, df in ticker_data.items():
+        _replay(imom, t, df[df.index >= split])
+    assert set(computed) == {"NEW"}  # A and B are only extended, NEW has no month to extend
+
+    full = IdiosyncMomentum(ticker_data, **kwargs)
+    for t in ["A", "B"]:
+        expected, actual = full._estimate_momentum(t), imom._cache[t]
+        assert actual.index.equals(expected.index)
+        for column in ["monthly_returns_less_rf", "residuals", "idiosync_momentum"]:
+            np.testing.assert_allclose(actual[column].values, expected[column].values, rtol=1e-9, atol=1e-12)
+    pd.testing.assert_frame_equal(imom.momentum_matrix, full.momentum_matrix, rtol=1e-9, atol=1e-12)
+
+
+def test_update_with_revised_bar_recomputes(ticker_data, monkeypatch):
+    imom = IdiosyncMomentum(ticker_data, factor_provider=_factors())
+    imom.estimate_universe()
+    before = imom._cache["A"]
+    revised = ticker_data["A"].loc[["2021-03-31"]] * 1.1  # close of a completed month
+
+    computed = []
+    real_compute = IdiosyncMomentum._compute
+    monkeypatch.setattr(IdiosyncMomentum, "_compute", lambda self, t: computed.append(t) or real_compute(self, t))
+    table = imom.update("A", revised)
+    assert computed == [["A"]]
+
+    expected = IdiosyncMomentum({**ticker_data, "A": imom.ticker_data["A"]}, factor_provider=_factors())
+    pd.testing.assert_frame_equal(table, expected._estimate_momentum("A"))
+    assert table.loc["2021-03-31", "monthly_return"] != before.loc["2021-03-31", "monthly_return"]
+
+
+@pytest.mark.parametrize("n_month", [-3, 0, 1, 2, 5, 12, 14, 15, 16, 30])
+def test_residual_momentum_matches_rolling_apply(n_month):
+    rng = np.random.default_rng(3)
+    residuals = pd.DataFrame(rng.normal(0, 0.02, (240, 3)), index=pd.date_range("2000-01-31", periods=240, freq="M"))
+    residuals.iloc[40:43, 0] = np.nan  # gaps shorter and longer than the window
+    residuals.iloc[100:130, 1] = np.nan
+    residuals.iloc[::17, 2] = np.nan
+
+    expected = residuals.rolling(15).apply(idiosync_momentum, kwargs={"n_month": n_month})
+    momentum = residual_momentum(residuals, n_month)
+    np.testing.assert_array_equal(momentum.values, expected.values)  # bitwise, NaN at the same places
+    np.testing.assert_array_equal(residual_momentum(residuals[0], n_month).values, expected[0].values)
+
+
+@pytest.fixture(scope="module")
+def regression_data():
+    # Daily-like data over enough steps for the running sums to drift, the factors have a non-zero mean
+    # where differences of long cumulative sums lose precision
+    rng = np.random.default_rng(0)
+    n, window, n_stocks = 5000, 250, 2
+    x = rng.normal(0.01, 0.01, (n, 3))
+    y = 0.0002 + x @ rng.normal(1.0, 0.5, (3, n_stocks)) + rng.normal(0, 0.02, (n, n_stocks))
+    y[[300, 3900], [0, 1]] = np.nan
+    return y, x, window, _statsmodels_reference(y, x, window)
+
+
+@pytest.mark.parametrize("method", ["projection", "cross_products", "online"])
+def test_rolling_regression_matches_statsmodels(regression_data, method):
+    y, x, window, reference = regression_data
+    if method == "online":
+        residuals = rolling_online_residuals(y, x, window)
+    else:
+        residuals = rolling_last_residuals(y, x, window, method=method)
+
+    np.testing.assert_array_equal(np.isnan(residuals), np.isnan(reference))
+    np.testing.assert_allclose(residuals, reference, rtol=0, atol=1e-13)
+
+
+def test_daily_batch_matches_per_ticker_with_mismatched_calendars():
+    full = _prices("2012-01-02", seed=0)
+    gaps = _prices("2012-01-02", seed=1)
+    ticker_data = {
+        "A": full,
+        "GAPS": gaps.drop(gaps.index[::21]),  # misses one day in 21 of the others' trading days
+        "LATE": _prices("2015-03-02", seed=2),
+    }
+    factors = _factors(start="2011-01-03", freq="B")
+    imom = IdiosyncMomentum(
+        ticker_data, rolling_window_coeff=120, rolling_window_mom=60, factor_provider=factors, frequency="D"
+    )
+    batch, per_ticker = imom._estimate_universe(list(ticker_data)), _per_ticker(imom, list(ticker_data))
+    _assert_tables_match(batch, per_ticker)
+    assert batch["GAPS"]["idiosync_momentum"].notna().sum() > 1000
+
+    lattice = imom.momentum_lattice([AdaptiveParameters(120, 60)])
+    assert list(lattice.tickers) == list(ticker_data)
+    for i, t in enumerate(lattice.tickers):
+        momentum = pd.Series(lattice.values[0, :, i], lattice.dates).dropna()
+        expected = per_ticker[t]["idiosync_momentum"].dropna()
+        np.testing.assert_allclose(momentum.values, expected.values, rtol=1e-9, atol=1e-12)
+        assert momentum.index.equals(expected.index)
@@ -0,0 +1,53 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from finstratb.misc.panel import OHLCVPanel
+
+
+def _frames(seed=0, n=300):
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i, start in enumerate(["2020-01-01", "2020-03-02"]):
+        index = pd.bdate_range(start, periods=n, name="date")
+        close = 50 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+        data[f"S{i}"] = pd.DataFrame(
+            {"volume": 1e6, "open": close, "high": close * 1.01, "low": close * 0.99, "close": close}, index=index
+        )
+    return data
+
+
+def _open_or_build(path):
+    return OHLCVPanel.open_or_build(_frames(), path).path
+
+
+def test_open_or_build_reuses_unchanged_data(tmp_path):
+    path = str(tmp_path / "panel")
+    data = _frames()
+    panel = OHLCVPanel.open_or_build(data, path)
+    pd.testing.assert_frame_equal(panel.frame("S1"), data["S1"][panel.fields], check_freq=False)
+
+    mtime = os.path.getmtime(os.path.join(panel.path, "values.dat"))
+    again = OHLCVPanel.open_or_build(_frames(), path)
+    assert again.path == panel.path
+    assert os.path.getmtime(os.path.join(again.path, "values.dat")) == mtime
+
+
+def test_changed_data_builds_new_version(tmp_path):
+    path = str(tmp_path / "panel")
+    old = OHLCVPanel.open_or_build(_frames(), path)
+    new = OHLCVPanel.open_or_build(_frames(seed=1), path)
+    assert new.path != old.path
+    assert OHLCVPanel(path).path == new.path
+    # The panel opened before the rebuild still reads its own version
+    pd.testing.assert_frame_equal(old.frame("S0"), OHLCVPanel(old.path).frame("S0"))
+
+
+def test_concurrent_builds(tmp_path):
+    path = str(tmp_path / "panel")
+    with ProcessPoolExecutor(4) as pool:
+        paths = list(pool.map(_open_or_build, [path] * 8))
+    assert len(set(paths)) == 1
+    assert sorted(os.listdir(path)) == sorted([os.path.basename(paths[0]), "current"])
@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from finstratb.misc.signals import Signal, TrendSignal
+
+
+def test_signal_is_abstract():
+    with pytest.raises(TypeError):
+        Signal()
+
+
+def test_trend_signal_as_of_lookup():
+    index = pd.bdate_range("2020-01-01", periods=200, name="date")
+    close = pd.Series(np.exp(np.linspace(0, 0.5, len(index))) * 10, index=index)
+    signal = TrendSignal({"A": pd.DataFrame({"close": close}), "B": pd.DataFrame({"close": close[50:]})}, periods=30)
+    assert np.isnan(signal.get_momentum("A", "2019-12-31"))
+    assert signal.get_momentum("A", index[100]) == signal.get_cross_section(index[100])["A"]
+    # Between two trading days the previous day's value holds
+    assert signal.get_momentum("A", index[100] + pd.Timedelta(hours=12)) == signal.get_momentum("A", index[100])
+    with pytest.raises(KeyError):
+        signal.get_momentum("C", index[100])
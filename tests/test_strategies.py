@@ -0,0 +1,79 @@
+import contextlib
+import datetime
+import io
+import os
+import sys
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+import pytest
+
+from finstratb.misc.broker import FastBroker
+from finstratb.misc.feeds import add_data_feeds
+from finstratb.misc.signals import TrendSignal
+
+pytest.importorskip("pyfolio")
+pytest.importorskip("quantstats")
+# The strategy scripts import the universes as a top-level module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "finstratb"))
+import strategy_momentum_gtaa_py_bb_atr_stoploss as gtaa  # noqa: E402
+
+
+def _prices(seed, start="2000-01-03", end="2008-12-31"):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(start, end, name="date")
+    close = 50 * np.exp(np.cumsum(rng.normal(0.0004, 0.012, len(index))))
+    return pd.DataFrame(
+        {"volume": 1e6, "open": close, "high": close * 1.01, "low": close * 0.99, "close": close}, index=index
+    )
+
+
+@pytest.fixture(scope="module")
+def universe():
+    return {t: _prices(seed) for seed, t in enumerate(["SPY", "TLT", "GLD", "A", "B", "C", "D", "E"])}
+
+
+class _Values(bt.Analyzer):
+    def start(self):
+        self.values = []
+
+    def next(self):
+        self.values.append((self.strategy.broker.getvalue(), self.strategy.broker.getcash()))
+
+
+def _run(data, fromdate, broker=None, **params):
+    cerebro = bt.Cerebro()
+    if broker is not None:
+        cerebro.broker = broker
+    cerebro.broker.setcash(100000.0)
+    cerebro.broker.set_coc(True)
+    cerebro.broker.set_checksubmit(checksubmit=False)
+    add_data_feeds(cerebro, data, fromdate=fromdate, plot=False)
+    cerebro.addstrategy(gtaa.Strategy, **params)
+    cerebro.addanalyzer(_Values, _name="values")
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        strategy = cerebro.run()[0]
+    return strategy.analyzers.values.values, log.getvalue().splitlines()
+
+
+def test_signal_rebalance_on_first_bar(universe):
+    # Monday 2005-01-03 is the first bar and a rebalance day, the timer fires before any bar has completed
+    fromdate = datetime.datetime(2005, 1, 1)
+    values, log = _run(universe, fromdate, momentum_instance=TrendSignal(universe, periods=90))
+    assert log[0] == "2005-01-03T00:00:00, ====== REBALANCING ======"
+    assert any("ORDER COMPLETED" in line for line in log)
+
+    indicator_values, _ = _run(universe, fromdate)
+    assert values == indicator_values  # same momentum as the per-ticker Momentum indicators
+
+
+def test_fast_broker_matches_back_broker(universe):
+    fromdate = datetime.datetime(2004, 12, 15)
+    signal = TrendSignal(universe, periods=90)
+    values, log = _run(universe, fromdate, momentum_instance=signal)
+    fast_values, fast_log = _run(universe, fromdate, broker=FastBroker(), momentum_instance=signal)
+    assert sum("ORDER COMPLETED" in line for line in log) > 50
+    assert fast_values == values  # value and cash of every bar
+    assert fast_log == log